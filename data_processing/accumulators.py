@@ -0,0 +1,133 @@
+import numpy as np
+
+from scipy.stats import norm
+
+
+class Count:
+    def __init__(self, shape=()):
+        """
+        Number of draws, and of draws in which each event happened.
+        :param shape: shape of the events of a single draw
+        """
+        self.n = 0
+        self.counts = np.zeros(shape, dtype=np.int64)
+
+    def update(self, events):
+        # events: (draws,) + shape booleans
+        events = np.asarray(events)
+        self.n += len(events)
+        self.counts += events.sum(axis=0)
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.counts += other.counts
+        return self
+
+    def probability(self):
+        return self.counts / max(self.n, 1)
+
+    def standard_error(self):
+        p = self.probability()
+        return np.sqrt(p * (1 - p) / max(self.n, 1))
+
+    def interval(self, confidence=0.95):
+        # Wilson score interval, which stays sensible for events that were seen rarely or never
+        z = norm.ppf(0.5 + confidence / 2)
+        n = max(self.n, 1)
+        p = self.probability()
+        center = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+        half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / (1 + z ** 2 / n)
+        return center - half_width, center + half_width
+
+
+class MeanVariance:
+    def __init__(self, shape=()):
+        """
+        Welford's running mean and sum of squared deviations, merged with Chan's pairwise update.
+        :param shape: shape of a single draw
+        """
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values):
+        # values: (draws,) + shape
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return self
+        batch = MeanVariance(values.shape[1:])
+        batch.n = len(values)
+        batch.mean = values.mean(axis=0)
+        batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        return self.merge(batch)
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.n / n)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.n * other.n / n)
+        self.n = n
+        return self
+
+    def variance(self, ddof=1):
+        return self.m2 / max(self.n - ddof, 1)
+
+    def standard_error(self):
+        return np.sqrt(self.variance() / max(self.n, 1))
+
+
+class Histogram:
+    def __init__(self, low, high, width=1):
+        """
+        Counts of draws in fixed bins [low + k * width, low + (k + 1) * width), and of draws outside of them.
+        The default width counts every integer from low to high, e.g. seat counts or vote margins.
+        :param low: lower edge of the first bin
+        :param high: last value counted, the upper edge is rounded up to a whole bin
+        :param width: width of every bin
+        """
+        self.low = low
+        self.width = width
+        self.counts = np.zeros(int(np.floor((high - low) / width)) + 1, dtype=np.int64)
+        self.outside = 0
+
+    @property
+    def n(self):
+        return int(self.counts.sum()) + self.outside
+
+    @property
+    def edges(self):
+        return self.low + self.width * np.arange(len(self.counts) + 1)
+
+    def update(self, values):
+        bins = np.floor((np.asarray(values) - self.low) / self.width).astype(np.int64).ravel()
+        inside = (bins >= 0) & (bins < len(self.counts))
+        self.counts += np.bincount(bins[inside], minlength=len(self.counts))
+        self.outside += int((~inside).sum())
+        return self
+
+    def merge(self, other):
+        if (self.low, self.width, len(self.counts)) != (other.low, other.width, len(other.counts)):
+            raise ValueError('Cannot merge histograms with different bins')
+        self.counts += other.counts
+        self.outside += other.outside
+        return self
+
+    def probability(self):
+        return self.counts / max(self.n, 1)
+
+
+class Summary(dict):
+    """
+    Named accumulators of a simulation run. Summaries of separate chunks, workers or runs with the same names
+    merge into the summary of all of their draws.
+    """
+    def merge(self, other):
+        for name, accumulator in other.items():
+            if name in self:
+                self[name].merge(accumulator)
+            else:
+                self[name] = accumulator
+        return self
@@ -0,0 +1,241 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import spearmanr
+from definitions import CYCLES, PARTIES, INFO_DIRS
+from elections import Country
+from scorer import Scorer
+from simulation import VICE_PRESIDENT_SCORE, worker_state, init_worker
+from votes import ChamberVote
+
+# Chambers scored by a backtest, and the extra voters of their chamber votes
+BACKTEST_CHAMBERS = {'house': None, 'senate': VICE_PRESIDENT_SCORE}
+
+def result_party(party):
+    # Party code of a results file or poll column, with third parties as independents
+    return party if party in ('D', 'R') else 'I'
+
+
+def actual_results(country):
+    """
+    Actual winner and margin of the races of a Country's cycle, from <cycle>_district_results.csv for the House,
+    then from the 'Final Results' rows of the cycle's poll files. Districts listed in the results file without any
+    votes were unopposed, and kept by the incumbent's party.
+
+    :param country: Country
+    :return: DataFrame indexed by (chamber, code), of the winning party and the democratic margin of the vote share
+    """
+    results = {}
+    results_path = os.path.join(country.data_dir, INFO_DIRS['house'], f'{country.cycle}_district_results.csv')
+    if os.path.exists(results_path):
+        results_df = pd.read_csv(results_path)
+        for code, district_df in results_df.groupby('code'):
+            district_df = district_df.dropna(subset=['party'])
+            if district_df.empty:
+                if code in country.representatives:
+                    results['house', code] = (country.representatives[code][1], 1.0)
+                continue
+            votes = dict(zip(district_df['party'], district_df['turnout']))
+            margin = (votes.get('D', 0) - votes.get('R', 0)) / sum(votes.values())
+            results['house', code] = (result_party(max(votes, key=votes.get)), margin)
+
+    for chamber in BACKTEST_CHAMBERS:
+        for code in country.race_table.codes[country.race_table.rows(chamber)]:
+            poll_df = country.poll_index.get(country.info_dir(chamber), code)
+            if (chamber, code) in results or poll_df is None:
+                continue
+            final_results = poll_df[poll_df['Poll'] == 'Final Results']
+            if final_results.empty:
+                continue
+            # Same candidate columns as Race.update_margin_and_scores
+            columns = list(poll_df.columns.values)
+            candidates = columns[4:-1] if ('MoE' in poll_df) else columns[3:-1]
+            shares = {candidate: float(final_results[candidate].iloc[0]) for candidate in candidates}
+            parties = {candidate: result_party(candidate[-2]) for candidate in candidates}
+            margin = sum(share if parties[candidate] == 'D' else -share if parties[candidate] == 'R' else 0
+                         for candidate, share in shares.items()) / 100
+            results[chamber, code] = (parties[max(shares, key=shares.get)], margin)
+
+    index = pd.MultiIndex.from_tuples(list(results), names=['chamber', 'code'])
+    return pd.DataFrame(list(results.values()), index=index, columns=['actual_party', 'actual_margin'])
+
+
+def backtest_cycle(scorer, vote, data_dir, cycle, seed, n_sims, bias_sd):
+    """
+    Predictions of a single cycle, next to its actual results.
+
+    :param scorer: Scorer shared by every cycle
+    :param vote: ChamberVote
+    :param data_dir: data directory
+    :param cycle: election cycle, a key of CYCLES
+    :param seed: SeedSequence of the cycle's simulations
+    :param n_sims: number of simulated elections
+    :param bias_sd: standard deviation of the national bias against republicans
+    :return: DataFrame of races, and list of dictionaries of chamber results
+    """
+    country = Country(data_dir, cycle, scorer)
+    actual = actual_results(country)
+    random_state = np.random.default_rng(seed)
+    biases = random_state.normal(0, bias_sd, n_sims)
+
+    races = []
+    chambers = []
+    for chamber, extra_scores in BACKTEST_CHAMBERS.items():
+        batch = country.race_batch(chamber)
+        tipping_points = country.tipping_point_probabilities(chamber)
+        # Seats and the chamber vote come from the same simulated elections
+        shares = batch.simulate_vote_shares(biases, random_state)
+        parties = batch.winning_parties(shares, vote)
+        party_probabilities = np.stack([(parties == i).mean(axis=0) for i in range(len(PARTIES))], axis=1)
+        democratic_seats = (parties == PARTIES.index('D')) @ batch.values
+        vote_margins = batch.results(shares >= 0.5, vote, extra_scores)
+
+        chamber_races = pd.DataFrame({
+            'cycle': cycle,
+            'chamber': chamber,
+            'code': batch.codes,
+            'incumbent_party': np.array(PARTIES)[batch.incumbent_parties],
+            'contested': batch.contested,
+            'value': batch.values,
+            'tipping_point_probability': [tipping_points[code] for code in batch.codes],
+            'democrat_win_probability': party_probabilities[:, PARTIES.index('D')],
+            'predicted_party': np.array(PARTIES)[party_probabilities.argmax(axis=1)]
+        }).merge(actual.reset_index(), on=['chamber', 'code'], how='left')
+        races.append(chamber_races)
+
+        chambers.append({
+            'cycle': cycle,
+            'chamber': chamber,
+            'predicted_seats': democratic_seats.mean(),
+            'seats_low': np.percentile(democratic_seats, 5),
+            'seats_high': np.percentile(democratic_seats, 95),
+            'pass_probability': np.mean(vote_margins > 0),
+            'chamber_power': np.mean(np.abs(vote_margins) == 1)
+        })
+    return pd.concat(races, ignore_index=True), chambers
+
+
+def _backtest_worker_cycle(data_dir, cycle, seed, n_sims, bias_sd):
+    return backtest_cycle(worker_state['scorer'], worker_state['vote'], data_dir, cycle, seed, n_sims, bias_sd)
+
+
+def score_chamber(races):
+    """
+    Accuracy of the predictions of a chamber's races that have an actual result.
+
+    :param races: races of a single cycle and chamber, from backtest_cycle
+    :return: dictionary of scores
+    """
+    scored = races.dropna(subset=['actual_party'])
+    contested = scored[scored['contested']]
+    democrat_won = scored['actual_party'] == 'D'
+    if len(scored) == len(races):
+        actual_seats = races['value'][races['actual_party'] == 'D'].sum()
+    else:
+        # Without every result, the composition of the chamber is unknown
+        actual_seats = np.nan
+
+    correlation = np.nan
+    if len(contested) > 2:
+        # Races most likely to be tipping points should have been the closest
+        correlation = spearmanr(contested['tipping_point_probability'], -contested['actual_margin'].abs())[0]
+
+    return {
+        'races': len(races),
+        'contested': int(races['contested'].sum()),
+        'scored': len(scored),
+        'accuracy': (scored['predicted_party'] == scored['actual_party']).mean() if len(scored) else np.nan,
+        'brier_score': ((scored['democrat_win_probability'] - democrat_won) ** 2).mean() if len(scored) else np.nan,
+        'contested_brier_score': ((contested['democrat_win_probability'] - (contested['actual_party'] == 'D')) ** 2
+                                  ).mean() if len(contested) else np.nan,
+        'actual_seats': actual_seats,
+        'tipping_point_correlation': correlation,
+        'top_tipping_point': races.loc[races['tipping_point_probability'].idxmax(), 'code']
+    }
+
+
+class Backtest:
+    def __init__(self, data_dir_name='../data', cycles=tuple(CYCLES), vote_file='obamacare_senate.csv',
+                 n_sims=10000, bias_sd=0.02, seed=None, max_workers=None, scorer=None):
+        """
+        Predict every cycle with the same model, one Country per cycle, and score the predictions against each
+        cycle's actual results. Cycles run in a pool of processes that share a single loaded Scorer, and each cycle
+        has its own child seed, so results don't depend on the number of workers.
+        :param data_dir_name: data directory, relative to this module as for Country
+        :param cycles: election cycles, keys of CYCLES
+        :param vote_file: vote file under <data_dir>/votes of the simulated chamber votes
+        :param n_sims: number of simulated elections per cycle
+        :param bias_sd: standard deviation of the national bias against republicans
+        :param seed: seed of the root SeedSequence, drawn from the OS when None
+        :param max_workers: number of processes, or 1 to run in this process
+        :param scorer: already loaded Scorer, read from the data directory when None
+        """
+        self.data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), data_dir_name)
+        unknown = set(cycles) - set(CYCLES)
+        if unknown:
+            raise ValueError(f'Unknown cycles {sorted(unknown)}, expected some of {sorted(CYCLES)}')
+        self.cycles = tuple(cycles)
+        self.n_sims = n_sims
+        self.bias_sd = bias_sd
+        # Keep the entropy so that a run without a seed can be repeated
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.max_workers = max_workers
+        self.scorer = Scorer(self.data_dir) if scorer is None else scorer
+        self.vote = ChamberVote(os.path.join(self.data_dir, 'votes', vote_file), self.scorer)
+        self.races = None
+
+    def run(self):
+        """
+        Backtest every cycle. Predictions of every race are kept in self.races.
+
+        :return: DataFrame indexed by (cycle, chamber), comparing predicted and actual results
+        """
+        seeds = np.random.SeedSequence(self.entropy).spawn(len(self.cycles))
+        n_cycles = len(self.cycles)
+        args = ([self.data_dir] * n_cycles, self.cycles, seeds, [self.n_sims] * n_cycles, [self.bias_sd] * n_cycles)
+
+        if self.max_workers == 1:
+            results = [backtest_cycle(self.scorer, self.vote, *cycle_args) for cycle_args in zip(*args)]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker,
+                                     initargs=({'scorer': self.scorer, 'vote': self.vote},)) as executor:
+                results = list(executor.map(_backtest_worker_cycle, *args))
+
+        self.races = pd.concat([races for races, _ in results], ignore_index=True)
+        comparison = pd.DataFrame([chamber for _, chambers in results for chamber in chambers])
+        scores = pd.DataFrame([
+            dict(cycle=cycle, chamber=chamber, **score_chamber(races))
+            for (cycle, chamber), races in self.races.groupby(['cycle', 'chamber'], sort=False)
+        ])
+        comparison = comparison.merge(scores, on=['cycle', 'chamber']).set_index(['cycle', 'chamber'])
+        return comparison[[
+            'races', 'contested', 'scored', 'accuracy', 'brier_score', 'contested_brier_score',
+            'predicted_seats', 'seats_low', 'seats_high', 'actual_seats',
+            'pass_probability', 'chamber_power', 'tipping_point_correlation', 'top_tipping_point'
+        ]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest every election cycle against its actual results')
+    parser.add_argument('--data', default='../data', help='data directory, relative to data_processing')
+    parser.add_argument('--cycles', nargs='+', type=int, default=list(CYCLES))
+    parser.add_argument('--vote', default='obamacare_senate.csv', help='vote file under data/votes')
+    parser.add_argument('--sims', type=int, default=10000, help='simulated elections per cycle')
+    parser.add_argument('--bias-sd', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='processes, one cycle each')
+    parser.add_argument('--races', default=None, help='CSV file to write the predictions of every race to')
+    args = parser.parse_args()
+
+    backtest = Backtest(args.data, args.cycles, args.vote, args.sims, args.bias_sd, args.seed, args.workers)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(backtest.run())
+    if args.races is not None:
+        backtest.races.to_csv(args.races, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,9 @@
+# Party codes used in columnar race data
+PARTIES = ('D', 'R', 'I')
+
+# Directory under data_dir for cached, derived files
+CACHE_DIR = '.cache'
+
 INFO_DIRS = {
     'ec': 'ec_info',
     'house': 'district_info',
@@ -6,6 +12,13 @@ INFO_DIRS = {
     'senate_2018': 'state_info_2018'
 }
 
+# Election of each chamber, i.e. its key in INFO_DIRS and RACE_STATUS, by election cycle
+CYCLES = {
+    2018: {'house': 'house_2018', 'senate': 'senate_2018'},
+    2020: {'ec': 'ec', 'house': 'house', 'senate': 'senate'}
+}
+DEFAULT_CYCLE = 2020
+
 RACE_STATUS = {
     'ec': {
         'safe_dem': {'MA', 'DE', 'NY', 'CA', 'DC', 'HI', 'MD', 'VT'},
@@ -47,3 +60,16 @@ RACE_STATUS = {
 }
 
 
+
+# Census divisions, grouping states whose polling errors tend to move together
+REGIONS = {
+    'new_england': {'CT', 'ME', 'MA', 'NH', 'RI', 'VT'},
+    'mid_atlantic': {'NJ', 'NY', 'PA'},
+    'east_north_central': {'IL', 'IN', 'MI', 'OH', 'WI'},
+    'west_north_central': {'IA', 'KS', 'MN', 'MO', 'NE', 'ND', 'SD'},
+    'south_atlantic': {'DE', 'DC', 'FL', 'GA', 'MD', 'NC', 'SC', 'VA', 'WV'},
+    'east_south_central': {'AL', 'KY', 'MS', 'TN'},
+    'west_south_central': {'AR', 'LA', 'OK', 'TX'},
+    'mountain': {'AZ', 'CO', 'ID', 'MT', 'NV', 'NM', 'UT', 'WY'},
+    'pacific': {'AK', 'CA', 'HI', 'OR', 'WA'}
+}
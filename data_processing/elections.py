@@ -2,23 +2,44 @@ import numpy as np
 import os
 import pandas as pd
 import re
+import threading
 
 from collections import defaultdict
 from scipy.stats import truncnorm, binom
 
 from scorer import Scorer
+from polls import PollIndex
+import snapshot
+from race_table import RaceTable, RaceBatch, RACE_COLUMNS, integrate_over_bias
+from fingerprint import value_digest
+from result_cache import ResultCache, RESULT_CACHE_SIZE, CACHE_MODES
+from results import GovernmentResults
+from scenario import StackedRows
+from simulation import DEFAULT_EXTRA_SCORES, NO_EXTRA_SCORES
 from definitions import *
 
 #
 class Country:
-    def __init__(self, data_dir_name):
+    def __init__(self, data_dir_name, cycle=DEFAULT_CYCLE, official_scorer=None):
+        """
+        Every race of an election cycle, with its polls.
+        :param data_dir_name: data directory, relative to this module
+        :param cycle: election cycle, a key of CYCLES, which decides the polls, senators and representatives read
+        :param official_scorer: Scorer to share between Countries, read from data_dir when None
+        """
+        if cycle not in CYCLES:
+            raise ValueError(f'Unknown cycle {cycle}, expected one of {sorted(CYCLES)}')
         self.data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),data_dir_name)
-        self.official_scorer = Scorer(self.data_dir)
+        self.cycle = cycle
+        self.elections = CYCLES[cycle]
+        self.official_scorer = Scorer(self.data_dir) if official_scorer is None else official_scorer
+        self.poll_index = PollIndex()
+        self.result_cache = None
         self.state_codes = {}
         self.state_turnouts = {}
-        self.district_turnouts = defaultdict(lambda: 0)
-        self.ec_turnouts = defaultdict(lambda: 0)
-        self.ec_values = defaultdict(lambda: 0)
+        self.district_turnouts = defaultdict(int)
+        self.ec_turnouts = defaultdict(int)
+        self.ec_values = defaultdict(int)
         self.senators = {}
         self.representatives = {}
         self.states = []
@@ -57,8 +78,8 @@ class Country:
                 self.state_turnouts[code.replace('E', 'ECD')] = turnout
 
         # Get elected officials
-        senators_df = pd.read_csv(os.path.join(state_info_dir, 'senators.csv'))
-        representatives_df = pd.read_csv(os.path.join(district_info_dir, 'representatives.csv'))
+        senators_df = pd.read_csv(os.path.join(self.info_dir('senate'), 'senators.csv'))
+        representatives_df = pd.read_csv(os.path.join(self.info_dir('house'), 'representatives.csv'))
 
         for index, row in senators_df.iterrows():
             state_name = row['state']
@@ -83,16 +104,29 @@ class Country:
             self.states.append(State(name, postal_code, district_codes[postal_code], self))
 
         self.infer_polling()
+        self.init_race_table()
+
+    def info_dir(self, chamber):
+        # Poll directory of a chamber in this cycle, or None if the chamber has no election in the cycle, like the
+        # electoral college in 2018
+        if chamber not in self.elections:
+            return None
+        return self.data_dir + '/' + INFO_DIRS[self.elections[chamber]]
 
-    def _infer_polling(self, race, status, projected_vote_shares, sample_sizes):
+    def status_elections(self):
+        # Elections whose polls inform races of the same status: this cycle's and earlier ones, never later ones
+        return {election for cycle, elections in CYCLES.items() if cycle <= self.cycle
+                for election in elections.values()}
 
-        similar_vote_shares = projected_vote_shares[status]
-        weights = sample_sizes[status]
+    def _infer_polling(self, race, status):
+
+        polls = list(self.status_polls[status].values())
 
         # Only if not "safe"
-        if similar_vote_shares:
+        if polls:
+            similar_vote_shares, weights = zip(*polls)
             gop_projected_vote_share = sum(np.array(similar_vote_shares) * np.array(weights)) / sum(weights)
-            race.sample_size = np.mean(sample_sizes[status])
+            race.sample_size = np.mean(weights)
         else:
             return
 
@@ -113,6 +147,7 @@ class Country:
         race.challenger_score = self.official_scorer.get_score(('_', challenger_party), race.code)
         race.challenger_party = challenger_party
         race.contested = True
+        race.inferred_status = status
 
     def infer_polling(self):
         """
@@ -120,96 +155,599 @@ class Country:
 
         :return:
         """
-        projected_vote_shares = defaultdict(lambda: [])
-        sample_sizes = defaultdict(lambda: [])
-        statuses = {}
+        # Polls of every race with a given status, by (election, code)
+        self.status_polls = defaultdict(dict)
+        self.statuses = {}
+        chambers = {election: chamber for chamber, election in self.elections.items()}
+        status_elections = self.status_elections()
         for election, races in RACE_STATUS.items():
+            if election not in status_elections:
+                continue
             for status, codes in races.items():
-                info_dir = self.data_dir + '/' + INFO_DIRS[election]
-                for code in codes:
-                    if not election.endswith('2018'):
-                        statuses[election + code] = status
-                    # Create a dummy race to get an average, if possible
-                    race = Race(
-                        code=code,
-                        turnout=self.state_turnouts,
-                        # Had to use dummy incumbent
-                        incumbent=('_', 'R'),
-                        official_scorer=self.official_scorer,
-                        info_dir=info_dir
-                    )
-                    if race.contested:
-                        projected_vote_shares[status].append(race.incumbent_projected_vote_share)
-                        sample_sizes[status].append(race.sample_size)
+                for code in sorted(codes):
+                    if election in chambers:
+                        self.statuses[chambers[election] + code] = status
+                    self.update_status_polls(election, status, code)
 
         for state in self.states:
             for district in state.districts.values():
-                if district.contested or ('house' + district.code not in statuses):
-                    continue
-                self._infer_polling(district, statuses['house' + district.code], projected_vote_shares, sample_sizes)
+                self.infer_race_polling('house', district)
             for senate_seat in state.senate_seats.values():
-                if senate_seat.contested or ('senate' + senate_seat.code not in statuses):
-                    continue
-                self._infer_polling(senate_seat, statuses['senate' + senate_seat.code], projected_vote_shares, sample_sizes)
+                self.infer_race_polling('senate', senate_seat)
             for electors in state.electoral_college.values():
-                if electors.contested or ('ec' + electors.code not in statuses):
-                    continue
-                self._infer_polling(electors, statuses['ec' + electors.code], projected_vote_shares, sample_sizes)
+                self.infer_race_polling('ec', electors)
 
-    def simulate_house(self, bias):
-        scores = np.zeros((435,2))  
-        i = 0 
-        for state in self.states:
-            for district in state.districts.values():
-                scores[i] = district.simulate_score(bias)
-                i += 1
-        return scores
+    def infer_race_polling(self, election, race):
+        if race.contested or (election + race.code not in self.statuses):
+            return
+        self._infer_polling(race, self.statuses[election + race.code])
 
-    def simulate_senate(self, bias):
-        scores = np.zeros((100,2))
-        i = 0 
-        for state in self.states:
-            for seat in state.senate_seats.values():
-                scores[i] = seat.simulate_score(bias)
-                i += 1
-        return scores
+    def update_status_polls(self, election, status, code):
+        """
+        Read the polls of a race into the polls of its status.
+
+        :return: whether the polls of the status changed
+        """
+        # Create a dummy race to get an average, if possible
+        race = Race(
+            code=code,
+            turnout=self.state_turnouts,
+            # Had to use dummy incumbent
+            incumbent=('_', 'R'),
+            official_scorer=self.official_scorer,
+            info_dir=self.data_dir + '/' + INFO_DIRS[election],
+            poll_index=self.poll_index
+        )
+        polls = self.status_polls[status]
+        previous = polls.get((election, code))
+        if race.contested:
+            polls[election, code] = (race.incumbent_projected_vote_share, race.sample_size)
+        else:
+            polls.pop((election, code), None)
+        return polls.get((election, code)) != previous
 
-    def simulate_government(self, bias, vote):
-        results = []
+    def refresh(self):
+        """
+        Re-read poll files that were added, removed or modified since they were read, without rebuilding the Country.
+        Only races polled by those files, and races whose polling is inferred from a status whose polls changed,
+        are updated, and only their cached tipping point probabilities are dropped.
 
-        for state in self.states:
-            for electors in state.electoral_college.values():
-                margin, party = electors.simulate_party(bias, vote)
-                results.append({
-                    'chamber': 'ec',
-                    'state': state.name,
-                    'code': electors.code,
-                    'party': party,
-                    'value': electors.value,
-                    'margin': margin
-                })
-            for district in state.districts.values():
-                margin, party = district.simulate_party(bias, vote)
-                results.append({
-                    'chamber': 'house',
-                    'state': state.name,
-                    'code': district.code,
-                    'party': party,
-                    'value': district.value,
-                    'margin': margin
-                })
-            for seat in state.senate_seats.values():
-                margin, party = seat.simulate_party(bias, vote)
-                results.append({
-                    'chamber': 'senate',
-                    'state': state.name,
-                    'code': seat.code,
-                    'party': party,
-                    'value': seat.value,
-                    'margin': margin
-                })
-
-        return pd.DataFrame(results)
+        :return: set of (chamber, code) of the updated races
+        """
+        changed_codes = {}
+        for info_dir in self.poll_index.scanned_dirs():
+            codes = self.poll_index.refresh(info_dir)
+            if codes:
+                changed_codes[info_dir] = codes
+        if not changed_codes:
+            return set()
+
+        changed_statuses = set()
+        status_elections = self.status_elections()
+        for election, races in RACE_STATUS.items():
+            if election not in status_elections:
+                continue
+            codes = changed_codes.get(os.path.normpath(self.data_dir + '/' + INFO_DIRS[election]), set())
+            for status, status_codes in races.items():
+                for code in sorted(status_codes & codes):
+                    if self.update_status_polls(election, status, code):
+                        changed_statuses.add(status)
+
+        # Cached probabilities can only be kept if nothing else edited the races
+        cache_valid = self.tipping_point_version == self.race_table.version
+
+        refreshed_rows = []
+        table = self.race_table
+        for row, (chamber, race) in enumerate(zip(table.chambers, table.races)):
+            polled = race.code in changed_codes.get(os.path.normpath(race.info_dir), ())
+            inferred = race.inferred_status is not None or not race.contested
+            if polled or (inferred and self.statuses.get(chamber + race.code) in changed_statuses):
+                race.reset_polling()
+                race.read_polls(self.poll_index)
+                self.infer_race_polling(chamber, race)
+                refreshed_rows.append(row)
+
+        if cache_valid:
+            for probabilities in self.tipping_point_cache.values():
+                probabilities[refreshed_rows] = np.nan
+            self.tipping_point_version = table.version
+        return {(str(table.chambers[row]), table.codes[row]) for row in refreshed_rows}
+
+    def watch(self, interval=60, callback=None, stop=None):
+        """
+        Keep a long-lived Country current by checking for new poll files every interval seconds.
+
+        :param interval: seconds between checks
+        :param callback: called with the (chamber, code) of updated races, whenever there are some
+        :param stop: threading.Event that ends the loop once set
+        :return:
+        """
+        stop = threading.Event() if stop is None else stop
+        while not stop.is_set():
+            refreshed = self.refresh()
+            if refreshed and callback is not None:
+                callback(refreshed)
+            stop.wait(interval)
+
+    def init_race_table(self):
+        """
+        Gather every race into a columnar RaceTable, so that many elections can be simulated at once.
+        Races are ordered by state, and within a state by electoral college, House and Senate.
+
+        :return:
+        """
+        races = []
+        chambers = []
+        state_indices = []
+        for i, state in enumerate(self.states):
+            for chamber, seats in (('ec', state.electoral_college),
+                                   ('house', state.districts),
+                                   ('senate', state.senate_seats)):
+                for race in seats.values():
+                    races.append(race)
+                    chambers.append(chamber)
+                    state_indices.append(i)
+
+        self.race_table = RaceTable(races, chambers, state_indices)
+        self.init_race_batches()
+
+    def init_race_batches(self):
+        # Views over the race table, by chamber and for the whole government
+        self.race_batches = {
+            chamber: RaceBatch(self.race_table, self.race_table.rows(chamber))
+            for chamber in ('ec', 'house', 'senate')
+        }
+        self.race_batches['government'] = RaceBatch(self.race_table, self.race_table.rows())
+
+        # Tipping point probabilities of every race, by mode, NaN until computed
+        self.tipping_point_cache = {}
+        self.tipping_point_version = self.race_table.version
+
+    def cached_tipping_points(self, mode):
+        if self.tipping_point_version != self.race_table.version:
+            # Races were edited outside of refresh, so none of the cached probabilities can be trusted
+            self.tipping_point_cache = {}
+            self.tipping_point_version = self.race_table.version
+        if mode not in self.tipping_point_cache:
+            self.tipping_point_cache[mode] = np.full(len(self.race_table), np.nan)
+        return self.tipping_point_cache[mode]
+
+    def use_result_cache(self, path=None, max_bytes=RESULT_CACHE_SIZE):
+        """
+        Keep the results of tipping point probabilities, exact chamber power and simulation runs on disk, keyed by
+        a hash of everything they depend on, so that repeated questions return without computing.
+
+        :param path: cache directory, defaults to <data_dir>/.cache/results
+        :param max_bytes: size beyond which the least recently used results are removed
+        :return: ResultCache
+        """
+        if path is None:
+            path = os.path.join(self.data_dir, CACHE_DIR, 'results')
+        self.result_cache = ResultCache(path, max_bytes)
+        return self.result_cache
+
+    def input_digest(self):
+        # Hash of every input of this Country's results: the contents of the scores and race info files, and the
+        # race table itself, so that races edited in memory don't hit results of the files
+        paths = [self.official_scorer.scores_path]
+        for info_dir in sorted(set(INFO_DIRS.values())):
+            for root, dirs, files in os.walk(os.path.join(self.data_dir, info_dir)):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        paths = [path for path in paths if os.path.isfile(path)]
+        return value_digest(
+            self.cycle,
+            [os.path.relpath(path, self.data_dir) for path in paths],
+            self.result_cache.file_digests(paths),
+            self.race_table.columns()
+        )
+
+    def cached_result(self, name, params, compute, cache='use'):
+        """
+        Result of compute(), from the result cache if there is one. See use_result_cache.
+
+        :param name: name of the computation
+        :param params: every parameter of the computation other than the Country's inputs
+        :param compute: function computing the result
+        :param cache: 'use' a cached result, 'refresh' it, or 'bypass' the cache
+        :return: result
+        """
+        if cache not in CACHE_MODES:
+            raise ValueError(f'Unknown cache mode: {cache}')
+        if self.result_cache is None or cache == 'bypass':
+            return compute()
+        key = value_digest(name, self.input_digest(), params)
+        return self.result_cache.call(key, compute, cache)
+
+    def save_snapshot(self, path):
+        """
+        Save this Country, so that it can be loaded without reading any of the files under data_dir.
+
+        :param path: snapshot directory
+        :return:
+        """
+        snapshot.save_snapshot(self, path)
+
+    @classmethod
+    def load_snapshot(cls, path, data_dir_name=None, cycle=None):
+        """
+        Load a Country saved with save_snapshot. If any file under data_dir changed since then, or if there is no
+        snapshot yet, the Country is built from data_dir and the snapshot is saved again.
+
+        :param path: snapshot directory
+        :param data_dir_name: data directory, defaults to the one the snapshot was saved from
+        :param cycle: election cycle, defaults to the snapshot's, or to DEFAULT_CYCLE without a snapshot
+        :return: Country
+        """
+        meta = snapshot.read_meta(path)
+        if data_dir_name is None:
+            if meta is None:
+                raise FileNotFoundError(f'No snapshot in {path}, and no data directory to build one from')
+            data_dir = meta['data_dir']
+        else:
+            data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), data_dir_name)
+        if cycle is None:
+            cycle = meta.get('cycle', DEFAULT_CYCLE) if meta is not None else DEFAULT_CYCLE
+
+        if snapshot.is_current(meta, data_dir, cycle):
+            return snapshot.load_snapshot(cls, path, meta)
+
+        country = cls(data_dir, cycle)
+        country.save_snapshot(path)
+        return country
+
+    def race_batch(self, chamber):
+        # Up to date view of a chamber's races
+        return self.race_batches[chamber].refresh()
+
+    def contested_columns(self, chamber):
+        # Columns of a chamber's contested races among the contested races of the government
+        government = self.race_batch('government')
+        chamber_batch = self.race_batch(chamber)
+        return np.searchsorted(government.rows[government.contested_index],
+                               chamber_batch.rows[chamber_batch.contested_index])
+
+    @staticmethod
+    def chamber_extra_scores(chamber, extra_scores=None):
+        # Voters of a chamber vote outside of its races, the vice president in the Senate unless given others
+        return DEFAULT_EXTRA_SCORES.get(chamber) if extra_scores is None else extra_scores
+
+    def race_biases(self, chamber, biases, error_model=None, random_state=None):
+        # National biases, or biases of each of the chamber's races when an error model correlates them by state
+        if error_model is None:
+            return biases
+        return error_model.race_biases(biases, random_state)[:, self.race_batches[chamber].rows]
+
+    def simulate_house(self, bias, random_state=None, error_model=None):
+        return self.simulate_house_batch([bias], random_state, error_model)[0]
+
+    def simulate_senate(self, bias, random_state=None, error_model=None):
+        return self.simulate_senate_batch([bias], random_state, error_model)[0]
+
+    def simulate_government(self, bias, vote, random_state=None, error_model=None):
+        return self.simulate_government_batch([bias], vote, random_state, error_model).drop(columns='sim')
+
+    def tipping_point_probabilities(self, chamber='house', mode='quadrature', cache='use'):
+        """
+        Probability that a voter changes the outcome of each race in a chamber.
+        Probabilities are cached until the races change, and in the result cache if there is one.
+
+        :param chamber: 'ec', 'house' or 'senate'
+        :param mode: 'quadrature' evaluates every race at once, 'analytic' uses a closed form approximation,
+                     'adaptive' integrates race by race as a slow reference, 'exact' calls
+                     Race.tipping_point_probability, whose integrator can miss the binomial peak
+        :param cache: 'use', 'refresh' or 'bypass' the result cache
+        :return: dictionary of race code to probability
+        """
+        if chamber not in ('ec', 'house', 'senate'):
+            raise ValueError(f'Unknown chamber: {chamber}')
+        if mode not in ('quadrature', 'analytic', 'adaptive', 'exact'):
+            raise ValueError(f'Unknown tipping point mode: {mode}')
+        return self.cached_result('tipping_point_probabilities', (chamber, mode),
+                                  lambda: self.compute_tipping_point_probabilities(chamber, mode), cache)
+
+    def compute_tipping_point_probabilities(self, chamber, mode):
+        table = self.race_table
+        rows = table.rows(chamber)
+        probabilities = self.cached_tipping_points(mode)
+        missing = rows[np.isnan(probabilities[rows])]
+        if len(missing):
+            if mode == 'exact':
+                probabilities[missing] = [table.races[row].tipping_point_probability() for row in missing]
+            elif mode == 'analytic':
+                probabilities[missing] = RaceBatch(table, missing).analytic_tipping_point_probabilities()
+            elif mode == 'adaptive':
+                probabilities[missing] = RaceBatch(table, missing).adaptive_tipping_point_probabilities()
+            else:
+                probabilities[missing] = RaceBatch(table, missing).tipping_point_probabilities()
+        return dict(zip(table.codes[rows], probabilities[rows]))
+
+    def tipping_point_error(self, chamber=None, mode='quadrature', reference='adaptive', min_probability=1e-12):
+        """
+        Compare a fast tipping point mode against a more careful one, by default adaptive quadrature with
+        breakpoints at the binomial peak. Relative deviations are only measured where the reference finds a
+        probability of at least min_probability, below which both are rounding noise. Don't use reference='exact':
+        the scalar integrator of Race.tipping_point_probability steps over the narrow binomial peak of many races,
+        missing their probability by orders of magnitude.
+
+        :param chamber: 'ec', 'house' or 'senate', or None for every loaded race
+        :param mode: mode to compare
+        :param reference: mode to compare against
+        :param min_probability: smallest reference probability included in the relative deviation
+        :return: largest absolute and relative deviations over contested races
+        """
+        approximate = []
+        references = []
+        for name in ([chamber] if chamber else ['ec', 'house', 'senate']):
+            contested = self.race_batch(name).contested_index
+            approximate.extend(np.array(list(self.tipping_point_probabilities(name, mode).values()))[contested])
+            references.extend(np.array(list(self.tipping_point_probabilities(name, reference).values()))[contested])
+
+        approximate = np.array(approximate)
+        references = np.array(references)
+        abs_errors = np.abs(approximate - references)
+        resolved = references >= min_probability
+        rel_errors = abs_errors[resolved] / references[resolved]
+        return {
+            'max_abs_error': abs_errors.max(initial=0.0),
+            'max_rel_error': rel_errors.max(initial=0.0)
+        }
+
+    def evaluate_scenarios(self, scenarios, vote, bias_sd=0.02, extra_scores=None, mode='quadrature'):
+        """
+        Tipping point probabilities and chamber power of many scenarios, without touching this Country.
+        Tipping points of races a scenario doesn't patch come from this Country's cache, and every patched race of
+        every scenario is evaluated in one batch. Chamber power is exact, as in chamber_pivot_probability: chambers
+        a scenario doesn't patch reuse this Country's power, the others go through a single stacked Poisson
+        binomial, and reuse this Country's seat votes unless their scores were patched.
+
+        :param scenarios: list of Scenario
+        :param vote: ChamberVote
+        :param bias_sd: standard deviation of the national bias against republicans
+        :param extra_scores: dictionary of chamber to scores of voters outside of its races,
+                             defaults to the vice president in the Senate
+        :param mode: 'quadrature' or 'analytic', see tipping_point_probabilities
+        :return: DataFrame of the power of the house and senate, and DataFrame of the tipping point probability of
+                 every (chamber, code), each with one row per scenario
+        """
+        if mode not in ('quadrature', 'analytic'):
+            raise ValueError(f'Unknown scenario tipping point mode: {mode}')
+        extra_scores = DEFAULT_EXTRA_SCORES if extra_scores is None else extra_scores
+        table = self.race_table
+        overlays = [scenario.overlay(table) for scenario in scenarios]
+        names = [i if scenario.name is None else scenario.name for i, scenario in enumerate(scenarios)]
+
+        # Fills the in-memory cache of every race, which a hit of the result cache would skip
+        for chamber in ('ec', 'house', 'senate'):
+            self.compute_tipping_point_probabilities(chamber, mode)
+        tipping_points = np.tile(self.cached_tipping_points(mode), (len(overlays), 1))
+        stacked = StackedRows([(overlay, overlay.patched_rows) for overlay in overlays])
+        if len(stacked):
+            batch = RaceBatch(stacked, np.arange(len(stacked)))
+            scenario_index = np.repeat(np.arange(len(overlays)), [len(overlay.patched_rows) for overlay in overlays])
+            patched_rows = np.concatenate([overlay.patched_rows for overlay in overlays])
+            tipping_points[scenario_index, patched_rows] = (batch.analytic_tipping_point_probabilities()
+                                                            if mode == 'analytic' else
+                                                            batch.tipping_point_probabilities())
+
+        power = {}
+        for chamber in ('house', 'senate'):
+            base_batch = self.race_batch(chamber)
+            extra = extra_scores.get(chamber, NO_EXTRA_SCORES)
+            power[chamber] = np.full(len(overlays), self.chamber_pivot_probability(vote, chamber, bias_sd, extra))
+
+            # Views of every scenario that patches this chamber
+            patched = [i for i, overlay in enumerate(overlays) if np.isin(overlay.patched_rows, base_batch.rows).any()]
+            if not patched:
+                continue
+            batches = []
+            for i in patched:
+                batch = RaceBatch(overlays[i], base_batch.rows)
+                if not {'incumbent_scores', 'challenger_scores', 'contested'} & overlays[i].patched_columns:
+                    batch.seat_votes = base_batch.seat_votes
+                batches.append(batch)
+
+            def pivot_probabilities(biases):
+                # (scenarios, biases) probabilities that the vote is decided by a single vote
+                frozen_results = []
+                yea_probabilities = []
+                for batch in batches:
+                    frozen_result, yeas = batch.yea_probabilities(biases, vote, extra)
+                    frozen_results.append(frozen_result)
+                    yea_probabilities.append(yeas)
+
+                # Scenarios may contest different numbers of seats, seats that never vote yea leave counts unchanged
+                n_seats = np.array([yeas.shape[1] for yeas in yea_probabilities])
+                padded = np.zeros((len(batches), len(biases), n_seats.max()))
+                for j, yeas in enumerate(yea_probabilities):
+                    padded[j, :, :n_seats[j]] = yeas
+                distributions = RaceBatch.poisson_binomial(padded.reshape(-1, n_seats.max())).reshape(
+                    len(batches), len(biases), -1)
+                margins = (np.array(frozen_results)[:, np.newaxis] + 2 * np.arange(n_seats.max() + 1)
+                           - n_seats[:, np.newaxis])
+                return (distributions * (np.abs(margins) == 1)[:, np.newaxis, :]).sum(axis=2)
+
+            power[chamber][patched] = integrate_over_bias(pivot_probabilities, bias_sd)
+
+        columns = pd.MultiIndex.from_arrays([table.chambers, table.codes], names=['chamber', 'code'])
+        return (pd.DataFrame(power, index=names),
+                pd.DataFrame(tipping_points, index=names, columns=columns))
+
+    def simulate_house_batch(self, biases, random_state=None, error_model=None):
+        # One (435, 2) matrix of scores per bias
+        biases = self.race_biases('house', biases, error_model, random_state)
+        return self.race_batches['house'].simulate_scores(biases, random_state)
+
+    def simulate_senate_batch(self, biases, random_state=None, error_model=None):
+        # One (100, 2) matrix of scores per bias
+        biases = self.race_biases('senate', biases, error_model, random_state)
+        return self.race_batches['senate'].simulate_scores(biases, random_state)
+
+    def simulate_chamber_results(self, chamber, biases, vote, extra_scores=None, random_state=None,
+                                 error_model=None):
+        """
+        Simulate the margin of a chamber vote for each bias, e.g. vote.get_result(self.simulate_senate(bias)).
+
+        :param chamber: 'house' or 'senate'
+        :param biases: national biases against republicans, one per simulated election
+        :param vote: ChamberVote
+        :param extra_scores: scores of voters outside of the chamber's races, defaults to the vice president in the
+                             Senate, NO_EXTRA_SCORES for none
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :param error_model: RegionalErrorModel adding errors correlated by state and region, or None
+        :return: array of vote margins
+        """
+        extra_scores = self.chamber_extra_scores(chamber, extra_scores)
+        biases = self.race_biases(chamber, biases, error_model, random_state)
+        return self.race_batches[chamber].simulate_results(biases, vote, extra_scores, random_state)
+
+    def simulate_library_results(self, chamber, biases, library, extra_scores=None, random_state=None,
+                                 error_model=None):
+        """
+        Simulate the margin of every roll call of a VoteLibrary taken in the chamber for each bias, all against the
+        same simulated chambers.
+
+        Arguments are the same as simulate_chamber_results, with a VoteLibrary instead of a ChamberVote.
+        :return: (biases, roll calls) array of vote margins, with the roll calls of library.chamber_votes(chamber)
+        """
+        library = library.chamber_votes(chamber)
+        extra_scores = self.chamber_extra_scores(chamber, extra_scores)
+        batch = self.race_batches[chamber]
+        # One column of seat votes per roll call
+        frozen_results, incumbent_votes, challenger_votes = batch.predict_seat_votes(library, extra_scores)
+        biases = self.race_biases(chamber, biases, error_model, random_state)
+        wins = batch.simulate_vote_shares(biases, random_state) >= 0.5
+        return frozen_results + wins @ incumbent_votes + ~wins @ challenger_votes
+
+    def simulate_seat_pivotality(self, chamber, biases, vote, extra_scores=None, random_state=None,
+                                 error_model=None):
+        """
+        Simulate the margin of a chamber vote for each bias, as simulate_chamber_results, along with how often each
+        seat was pivotal in those same elections: electing its other candidate would have changed whether the vote
+        passed. This replaces weighting every seat by the same chamber power.
+
+        :param chamber: 'house' or 'senate'
+        :param biases: national biases against republicans, one per simulated election
+        :param vote: ChamberVote
+        :param extra_scores: scores of voters outside of the chamber's races, defaults to the vice president in the
+                             Senate, NO_EXTRA_SCORES for none
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :param error_model: RegionalErrorModel adding errors correlated by state and region, or None
+        :return: array of vote margins, and dictionary of race code to the share of elections it was pivotal in
+        """
+        extra_scores = self.chamber_extra_scores(chamber, extra_scores)
+        batch = self.race_batches[chamber]
+        biases = self.race_biases(chamber, biases, error_model, random_state)
+        margins, pivots = batch.simulate_pivots(biases, vote, extra_scores, random_state)
+        return margins, dict(zip(batch.codes, pivots.mean(axis=0)))
+
+    def chamber_pivot_probability(self, vote, chamber, bias_sd, extra_scores=None, cache='use'):
+        """
+        Exact probability that a chamber vote is decided by a single vote, i.e. abs(vote.get_result(...)) == 1,
+        integrating the exact margin distribution over a normal national bias, see RaceBatch.pivot_probability.
+
+        :param vote: ChamberVote
+        :param chamber: 'house' or 'senate'
+        :param bias_sd: standard deviation of the national bias against republicans
+        :param extra_scores: scores of voters outside of the chamber's races, defaults to the vice president in the
+                             Senate, NO_EXTRA_SCORES for none
+        :param cache: 'use', 'refresh' or 'bypass' the result cache
+        :return: probability
+        """
+        extra_scores = self.chamber_extra_scores(chamber, extra_scores)
+        params = (vote.digest(), chamber, bias_sd, extra_scores)
+        return self.cached_result('chamber_pivot_probability', params,
+                                  lambda: self.compute_chamber_pivot_probability(vote, chamber, bias_sd, extra_scores),
+                                  cache)
+
+    def compute_chamber_pivot_probability(self, vote, chamber, bias_sd, extra_scores=None):
+        return self.race_batches[chamber].pivot_probability(vote, bias_sd, extra_scores)
+
+    def simulate_government_batch(self, biases, vote, random_state=None, error_model=None):
+        # Same rows as simulate_government, stacked for every bias and labeled by simulation
+        table = self.race_table
+        biases = self.race_biases('government', biases, error_model, random_state)
+        margins, parties = self.race_batches['government'].simulate_parties(biases, vote, random_state)
+        n_sims, n_races = margins.shape
+        state_names = np.array([state.name for state in self.states])
+        return pd.DataFrame({
+            'sim': np.repeat(np.arange(n_sims), n_races),
+            'chamber': np.tile(table.chambers, n_sims),
+            'state': np.tile(state_names[table.state_indices], n_sims),
+            'code': np.tile(table.codes, n_sims),
+            'party': np.array(PARTIES)[parties.ravel()],
+            'value': np.tile(table.values, n_sims),
+            'margin': margins.ravel()
+        })
+
+    def sweep_bias(self, biases, n_sims, vote, extra_scores=None, random_state=None):
+        """
+        How control of each chamber, and the odds of a chamber vote being decided by a single vote, shift with the
+        national bias. Every race is drawn n_sims times once, and the same draws are shifted by every bias (common
+        random numbers), so that curves are smooth and differences between biases are not sampling noise.
+
+        :param biases: national biases against republicans, e.g. np.linspace(-0.04, 0.04, 81)
+        :param n_sims: number of elections simulated for every bias
+        :param vote: ChamberVote
+        :param extra_scores: dictionary of chamber to scores of voters outside of its races,
+                             defaults to the vice president in the Senate
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :return: DataFrame indexed by bias, with the expected democratic seats (or electoral votes) and probability
+                 of democratic control of every chamber, and the probability of a single vote margin in the house
+                 and senate
+        """
+        extra_scores = DEFAULT_EXTRA_SCORES if extra_scores is None else extra_scores
+        table = self.race_table
+        batch = self.race_batch('government')
+        base_shares = batch.simulate_base_shares(n_sims, random_state)
+        incumbent_parties = batch.resolve_parties(batch.incumbent_parties, batch.incumbent_scores, vote)
+        challenger_parties = batch.resolve_parties(batch.challenger_parties, batch.challenger_scores, vote)
+        democrat = PARTIES.index('D')
+        republican = PARTIES.index('R')
+
+        chamber_columns = {chamber: self.contested_columns(chamber) for chamber in ('house', 'senate')}
+
+        sweep = []
+        for bias in biases:
+            shares = base_shares + batch.bias_signs * bias
+            parties = np.where(batch.incumbent_wins(shares), incumbent_parties, challenger_parties)
+            row = {'bias': bias}
+            for chamber in ('ec', 'house', 'senate'):
+                rows = table.chambers == chamber
+                democratic_seats = (parties[:, rows] == democrat) @ table.values[rows]
+                republican_seats = (parties[:, rows] == republican) @ table.values[rows]
+                row[chamber + '_democratic_seats'] = democratic_seats.mean()
+                row[chamber + '_democratic_control'] = np.mean(democratic_seats > republican_seats)
+            for chamber, columns in chamber_columns.items():
+                frozen_result, incumbent_votes, challenger_votes = self.race_batch(chamber).predict_seat_votes(
+                    vote, extra_scores.get(chamber))
+                margins = frozen_result + np.where(shares[:, columns] >= 0.5, incumbent_votes, challenger_votes).sum(axis=1)
+                row[chamber + '_power'] = np.mean(np.abs(margins) == 1)
+            sweep.append(row)
+        return pd.DataFrame(sweep).set_index('bias')
+
+    def simulate_government_stream(self, biases, vote, path, batch_size=1000, chunk_size=10000, random_state=None,
+                                   error_model=None):
+        """
+        Simulate one government per bias straight to disk, holding at most batch_size elections in memory.
+
+        :param biases: national bias against republicans of every election
+        :param vote: ChamberVote used to resolve independents
+        :param path: directory of the results, see GovernmentResults
+        :param batch_size: number of elections simulated at once
+        :param chunk_size: number of elections per file
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :param error_model: RegionalErrorModel adding errors correlated by state and region, or None
+        :return: GovernmentResultsReader over the simulated elections
+        """
+        batch = self.race_batches['government']
+        results = GovernmentResults(self, path, chunk_size)
+        for start in range(0, len(biases), batch_size):
+            batch_biases = biases[start:start + batch_size]
+            race_biases = self.race_biases('government', batch_biases, error_model, random_state)
+            margins, parties = batch.simulate_parties(race_biases, vote, random_state)
+            results.append(batch_biases, margins, parties)
+        return results.close()
 
 
 
@@ -220,24 +758,26 @@ class State:
         self.district_codes = district_codes
         self.country = country
 
-        self.state_info_dir = country.data_dir + '/state_info'
-        self.district_info_dir = country.data_dir + '/district_info'
-        self.ec_info_dir = country.data_dir + '/ec_info'
+        self.state_info_dir = country.info_dir('senate')
+        self.district_info_dir = country.info_dir('house')
+        self.ec_info_dir = country.info_dir('ec')
 
         self.ec_value = country.ec_values[postal_code]
         self.cd_codes = []
         if postal_code in ('ME', 'NE'):
             self.cd_codes = [f"{postal_code}CD{i+1}" for i in range(self.ec_value - 2)]
 
+        # No electoral college in cycles without a presidential election
         incumbent = ('Trump', 'R') if postal_code not in RACE_STATUS['ec']['safe_dem'] else ('Biden', 'D')
-        self.electoral_college = {
+        self.electoral_college = {} if self.ec_info_dir is None else {
             code: Race(
                 code=code,
                 turnout=country.state_turnouts[code],
                 incumbent=incumbent,
                 official_scorer=country.official_scorer,
                 info_dir=self.ec_info_dir,
-                value=self.ec_value - len(self.cd_codes) if len(code) == 2 else 1
+                value=self.ec_value - len(self.cd_codes) if len(code) == 2 else 1,
+                poll_index=country.poll_index
             )
             for code in self.cd_codes + [postal_code]
         }
@@ -255,20 +795,56 @@ class State:
                 turnout=self.country.state_turnouts[code],
                 incumbent=self.country.senators[code],
                 official_scorer=self.country.official_scorer,
-                info_dir=self.state_info_dir
+                info_dir=self.state_info_dir,
+                poll_index=self.country.poll_index
             )
 
-        for code in self.district_codes:
+        for code in sorted(self.district_codes):
             self.districts[code] = Race(
                 code=code,
                 turnout=self.country.district_turnouts[code],
                 incumbent=self.country.representatives[code],
                 official_scorer=self.country.official_scorer,
-                info_dir=self.state_info_dir
+                info_dir=self.district_info_dir,
+                poll_index=self.country.poll_index
             )
 
+class RaceColumn:
+    # Race attribute that lives in a RaceTable column once the race is bound to a table
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, race, owner=None):
+        if race is None:
+            return self
+        if race.table is None:
+            return race.__dict__[self.name]
+        return race.table.get(race.row, self.name)
+
+    def __set__(self, race, value):
+        if race.table is None:
+            race.__dict__[self.name] = value
+        else:
+            race.table.set(race.row, self.name, value)
+
+
 class Race:
-    def __init__(self, code, turnout, incumbent, official_scorer, info_dir, value=1):
+    code = RaceColumn()
+    turnout = RaceColumn()
+    value = RaceColumn()
+    contested = RaceColumn()
+    sample_size = RaceColumn()
+    incumbent_projected_vote_share = RaceColumn()
+    incumbent = RaceColumn()
+    incumbent_score = RaceColumn()
+    challenger_score = RaceColumn()
+    challenger_party = RaceColumn()
+
+    # Set once the Country gathers its races into a RaceTable
+    table = None
+    row = None
+
+    def __init__(self, code, turnout, incumbent, official_scorer, info_dir, value=1, poll_index=None):
         """
         Races represent the state of an individual election.
         You need to set the incumbent at init time, so the default score can be recorded in "uncontested" or safe races
@@ -278,25 +854,41 @@ class Race:
         :param official_scorer:
         :param info_dir:
         :param value:
+        :param poll_index: PollIndex shared between races, so that directories are listed and polls read once
         """
         self.code = code
         self.turnout = turnout
-        self.incumbent = incumbent
+        self.default_incumbent = incumbent
+        self.info_dir = info_dir
+        self.official_scorer = official_scorer
+        self.value = value
+
+        self.reset_polling()
+        self.read_polls(PollIndex() if poll_index is None else poll_index)
+
+    def reset_polling(self):
+        # Back to a safe race for the incumbent, as before any poll was read or inferred
+        self.incumbent = self.default_incumbent
         self.contested = False
+        self.inferred_status = None
         self.incumbent_projected_vote_share = 1
         self.sample_size = 0
-        self.official_scorer = official_scorer
-        self.incumbent_score = official_scorer.get_score(incumbent, code)
+        self.incumbent_score = self.official_scorer.get_score(self.default_incumbent, self.code)
         self.challenger_score = None
-        self.challenger_party = 'D' if incumbent[1] == 'R' else 'R'
-        self.value = value
+        self.challenger_party = 'D' if self.default_incumbent[1] == 'R' else 'R'
 
-        for poll in os.listdir(info_dir):
-            if poll.startswith(code + '_'):
-                self.contested = True
-                poll_df = pd.read_csv(os.path.join(info_dir, poll))
-                self.update_margin_and_scores(poll_df)
-                break
+    def read_polls(self, poll_index):
+        poll_df = poll_index.get(self.info_dir, self.code)
+        if poll_df is not None:
+            self.contested = True
+            self.update_margin_and_scores(poll_df)
+
+    def bind(self, table, row):
+        # From now on, this race is a view over a row of the table
+        self.table = table
+        self.row = row
+        for name in RACE_COLUMNS:
+            self.__dict__.pop(name, None)
 
     def update_margin_and_scores(self, poll_df):
         """
@@ -403,10 +995,10 @@ class Race:
         count = norm_count * stddev + expected_value
         return count
 
-    def simulate_party(self, bias, vote):
+    def simulate_party(self, bias, vote, random_state=None):
         # Simulate a race score based on a given bias against republicans
         if self.contested:
-            norm_count = self.norm_vote_count_distribution().rvs(1)
+            norm_count = self.norm_vote_count_distribution().rvs(1, random_state=random_state)
             count = self.denormalize_vote_count(norm_count)
             p = count / self.sample_size
 
@@ -437,10 +1029,10 @@ class Race:
 
         return margin, party
 
-    def simulate_score(self, bias):
+    def simulate_score(self, bias, random_state=None):
         # Simulate a race score based on a given bias against republicans
         if self.contested:
-            norm_count = self.norm_vote_count_distribution().rvs(1)
+            norm_count = self.norm_vote_count_distribution().rvs(1, random_state=random_state)
             count = self.denormalize_vote_count(norm_count) 
             p = count / self.sample_size
 
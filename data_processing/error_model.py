@@ -0,0 +1,44 @@
+import numpy as np
+
+from definitions import REGIONS
+
+
+class RegionalErrorModel:
+    def __init__(self, country, region_sd=0.01, state_sd=0.01):
+        """
+        Polling errors shared by the races of a state, and partly by the states of a region, on top of the national
+        bias. The covariance between two states is region_sd ** 2 if they are in the same region, plus state_sd ** 2
+        if they are the same state. Errors are sampled from a factor of the covariance built from that structure, one
+        column per region and one per state, so any number of elections are sampled with a single matrix product,
+        and either standard deviation may be zero.
+        :param country: Country
+        :param region_sd: standard deviation of the error shared by a region's states
+        :param state_sd: standard deviation of the error of a single state, shared by its races
+        """
+        self.country = country
+        self.region_sd = region_sd
+        self.state_sd = state_sd
+
+        region_of = {postal_code: region for region, postal_codes in REGIONS.items() for postal_code in postal_codes}
+        regions = np.array([region_of[state.postal_code] for state in country.states])
+        region_indicator = regions[:, np.newaxis] == np.array(list(REGIONS))[np.newaxis, :]
+        # factor @ factor.T is the covariance, even when it is only positive semidefinite
+        self.factor = np.hstack((region_sd * region_indicator, state_sd * np.eye(len(regions))))
+        self.covariance = self.factor @ self.factor.T
+
+    def sample_state_errors(self, n_sims, random_state=None):
+        # One row of state errors per election, in the order of country.states
+        normal = np.random.standard_normal if random_state is None else random_state.standard_normal
+        return normal((n_sims, self.factor.shape[1])) @ self.factor.T
+
+    def race_biases(self, biases, random_state=None):
+        """
+        Bias against republicans of every race of the race table.
+
+        :param biases: national biases against republicans, one per election
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :return: (elections, races) biases
+        """
+        biases = np.asarray(biases, dtype=float).reshape(-1, 1)
+        state_errors = self.sample_state_errors(len(biases), random_state)
+        return biases + state_errors[:, self.country.race_table.state_indices]
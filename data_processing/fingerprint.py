@@ -0,0 +1,62 @@
+import hashlib
+import os
+import numpy as np
+
+# Read files in 1 MB blocks when hashing them
+BLOCK_SIZE = 1 << 20
+
+
+def file_stat(path):
+    # Cheap check of whether a file may have changed
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_digest(path):
+    # Hash of a file's contents
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_arrays(path, **arrays):
+    # Write arrays to an .npz file then rename it, so that readers never see a partial file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+    except OSError:
+        # Read-only data directories just don't get a cache
+        pass
+
+
+def update_digest(digest, value):
+    # Feed a value into a hash, by content: arrays by dtype, shape and data, containers item by item
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, np.ndarray):
+        digest.update(f'array {value.dtype.str} {value.shape}'.encode())
+        digest.update(repr(value.tolist()).encode() if value.dtype == object else np.ascontiguousarray(value).data)
+    elif isinstance(value, dict):
+        digest.update(b'dict')
+        for key in sorted(value, key=repr):
+            update_digest(digest, key)
+            update_digest(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__} {len(value)}'.encode())
+        for item in value:
+            update_digest(digest, item)
+    else:
+        digest.update(f'{type(value).__name__} {value!r}'.encode())
+    digest.update(b';')
+
+
+def value_digest(*values):
+    # Hash of values, equal whenever the values are
+    digest = hashlib.sha256()
+    for value in values:
+        update_digest(digest, value)
+    return digest.hexdigest()
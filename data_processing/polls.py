@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+
+from fingerprint import file_stat
+
+
+class PollIndex:
+    def __init__(self):
+        """
+        Poll files of every info directory, keyed by race code.
+        Each directory is listed once, and each poll file is read once, the first time its race asks for it.
+        """
+        self.poll_files = {}
+        self.poll_stats = {}
+        self.polls = {}
+
+    def scan(self, info_dir):
+        """
+        List a directory's poll files, named like <code>_<name>_<party>.csv, by race code.
+
+        :param info_dir:
+        :return: dictionary of race code to poll file path
+        """
+        info_dir = os.path.normpath(info_dir)
+        if info_dir not in self.poll_files:
+            poll_files = {}
+            for poll in os.listdir(info_dir):
+                code = poll.split('_', 1)[0]
+                # Same as looking for the first file that starts with code + '_'
+                if '_' in poll and code not in poll_files:
+                    poll_files[code] = os.path.join(info_dir, poll)
+                    self.poll_stats[poll_files[code]] = file_stat(poll_files[code])
+            self.poll_files[info_dir] = poll_files
+        return self.poll_files[info_dir]
+
+    def scanned_dirs(self):
+        return list(self.poll_files)
+
+    def refresh(self, info_dir):
+        """
+        List a scanned directory again, and forget the polls of files that were added, removed or modified.
+
+        :param info_dir:
+        :return: codes of the races whose poll file changed
+        """
+        info_dir = os.path.normpath(info_dir)
+        previous_files = self.poll_files.pop(info_dir, None)
+        if previous_files is None:
+            return set()
+        previous_stats = {path: self.poll_stats.pop(path, None) for path in previous_files.values()}
+        poll_files = self.scan(info_dir)
+
+        changed = set()
+        for code in set(previous_files) | set(poll_files):
+            previous_path = previous_files.get(code)
+            path = poll_files.get(code)
+            if path != previous_path or self.poll_stats[path] != previous_stats[path]:
+                changed.add(code)
+                self.polls.pop(previous_path, None)
+                self.polls.pop(path, None)
+        return changed
+
+    def get(self, info_dir, code):
+        """
+        Polls of a race.
+
+        :param info_dir:
+        :param code:
+        :return: DataFrame of polls, or None if the race has no poll file
+        """
+        path = self.scan(info_dir).get(code)
+        if path is None:
+            return None
+        if path not in self.polls:
+            self.polls[path] = pd.read_csv(path)
+        return self.polls[path]
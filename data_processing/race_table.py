@@ -0,0 +1,487 @@
+import numpy as np
+
+from scipy.integrate import quad
+from scipy.special import ndtr, xlog1py
+from scipy.stats import truncnorm, binom, norm
+
+from definitions import PARTIES
+
+# Gauss-Legendre grid used for batched tipping point probabilities
+QUADRATURE_ORDER = 64
+QUADRATURE_WIDTH = 10
+
+# Composite Simpson grid over the national bias, from -BIAS_GRID_WIDTH to BIAS_GRID_WIDTH standard deviations.
+# Chamber pivot probabilities peak in a band of bias far narrower than its standard deviation, so the grid is halved
+# until the integral changes by less than BIAS_GRID_TOLERANCE, relative to its value
+BIAS_GRID_WIDTH = 6
+BIAS_GRID_POINTS = 257
+BIAS_GRID_MAX_POINTS = 2 ** 16 + 1
+BIAS_GRID_TOLERANCE = 1e-6
+
+# Race attributes stored in table columns
+RACE_COLUMNS = {
+    'code': 'codes',
+    'turnout': 'turnouts',
+    'value': 'values',
+    'contested': 'contested',
+    'sample_size': 'sample_sizes',
+    'incumbent_projected_vote_share': 'incumbent_projected_vote_shares',
+    'incumbent_score': 'incumbent_scores',
+    'challenger_score': 'challenger_scores',
+    'incumbent': 'incumbent_parties',
+    'challenger_party': 'challenger_parties'
+}
+
+# Every column of a RaceTable
+TABLE_COLUMNS = ['chambers', 'state_indices', 'codes', 'turnouts', 'values', 'contested', 'sample_sizes',
+                 'incumbent_projected_vote_shares', 'incumbent_names', 'incumbent_parties', 'challenger_parties',
+                 'incumbent_scores', 'challenger_scores']
+
+
+def integrate_over_bias(function, bias_sd):
+    """
+    Expectation of function over a normal national bias, on a composite Simpson grid refined until it converges.
+
+    :param function: maps an array of biases to an (..., biases) array of values
+    :param bias_sd: standard deviation of the national bias against republicans
+    :return: (...) array of expectations
+    """
+    if bias_sd == 0:
+        return function(np.zeros(1))[..., 0]
+    biases = np.linspace(-BIAS_GRID_WIDTH * bias_sd, BIAS_GRID_WIDTH * bias_sd, BIAS_GRID_POINTS)
+    values = function(biases)
+    estimate = simpson_expectation(values, biases, bias_sd)
+    while len(biases) < BIAS_GRID_MAX_POINTS:
+        # Halve the spacing, only evaluating the new midpoints
+        midpoints = (biases[:-1] + biases[1:]) / 2
+        midpoint_values = function(midpoints)
+        refined_biases = np.empty(2 * len(biases) - 1)
+        refined_biases[::2] = biases
+        refined_biases[1::2] = midpoints
+        refined_values = np.empty(values.shape[:-1] + refined_biases.shape)
+        refined_values[..., ::2] = values
+        refined_values[..., 1::2] = midpoint_values
+        refined = simpson_expectation(refined_values, refined_biases, bias_sd)
+
+        converged = np.all(np.abs(refined - estimate) <= BIAS_GRID_TOLERANCE * np.abs(refined))
+        biases, values, estimate = refined_biases, refined_values, refined
+        if converged:
+            break
+    return estimate
+
+
+def simpson_expectation(values, biases, bias_sd):
+    # Composite Simpson rule on an odd number of evenly spaced biases, weighted by the normal density
+    weights = np.full(len(biases), 2.0)
+    weights[1::2] = 4
+    weights[[0, -1]] = 1
+    weights *= norm.pdf(biases, scale=bias_sd)
+    return values @ weights / weights.sum()
+
+
+class RaceTable:
+    def __init__(self, races, chambers, state_indices):
+        """
+        Columnar state of every race in a Country. Once built, races read and write their attributes here.
+        :param races: Race objects
+        :param chambers: chamber of each race, i.e. 'ec', 'house' or 'senate'
+        :param state_indices: index of each race's state in Country.states
+        """
+        self.races = races
+        self.chambers = np.array(chambers)
+        self.state_indices = np.array(state_indices, dtype=int)
+
+        self.codes = np.array([race.code for race in races], dtype=object)
+        self.turnouts = np.array([race.turnout for race in races], dtype=float)
+        self.values = np.array([race.value for race in races], dtype=int)
+        self.contested = np.array([race.contested for race in races], dtype=bool)
+        self.sample_sizes = np.array([race.sample_size for race in races], dtype=float)
+        self.incumbent_projected_vote_shares = np.array(
+            [race.incumbent_projected_vote_share for race in races], dtype=float)
+
+        self.incumbent_names = np.array([race.incumbent[0] for race in races], dtype=object)
+        self.incumbent_parties = np.array([PARTIES.index(race.incumbent[1]) for race in races], dtype=np.int8)
+        self.challenger_parties = np.array([PARTIES.index(race.challenger_party) for race in races], dtype=np.int8)
+
+        # Missing scores are stored as NaN
+        self.incumbent_scores = np.array([race.incumbent_score for race in races], dtype=float).reshape(-1, 2)
+        self.challenger_scores = np.array([
+            np.full(2, np.nan) if race.challenger_score is None else race.challenger_score
+            for race in races
+        ], dtype=float).reshape(-1, 2)
+
+        # Bumped on every write, so that views know to recompute
+        self.version = 0
+
+        for row, race in enumerate(races):
+            race.bind(self, row)
+
+    @classmethod
+    def from_columns(cls, races, columns):
+        """
+        Rebuild a table from saved columns, binding races that have no state of their own yet.
+        :param races: one unbound Race per row
+        :param columns: dictionary of column name to array, for every name in TABLE_COLUMNS
+        :return: RaceTable
+        """
+        table = cls.__new__(cls)
+        table.races = races
+        for name in TABLE_COLUMNS:
+            setattr(table, name, columns[name])
+        table.version = 0
+        for row, race in enumerate(races):
+            race.bind(table, row)
+        return table
+
+    def columns(self):
+        return {name: getattr(self, name) for name in TABLE_COLUMNS}
+
+    def __len__(self):
+        return len(self.races)
+
+    def rows(self, chamber=None):
+        if chamber is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.chambers == chamber)
+
+    def get(self, row, name):
+        if name == 'incumbent':
+            return self.incumbent_names[row], PARTIES[self.incumbent_parties[row]]
+        elif name == 'challenger_party':
+            return PARTIES[self.challenger_parties[row]]
+        elif name in ('incumbent_score', 'challenger_score'):
+            score = getattr(self, RACE_COLUMNS[name])[row]
+            return None if np.isnan(score).any() else score
+        return getattr(self, RACE_COLUMNS[name])[row]
+
+    def set(self, row, name, value):
+        if name == 'incumbent':
+            self.incumbent_names[row] = value[0]
+            self.incumbent_parties[row] = PARTIES.index(value[1])
+        elif name == 'challenger_party':
+            self.challenger_parties[row] = PARTIES.index(value)
+        elif name in ('incumbent_score', 'challenger_score'):
+            getattr(self, RACE_COLUMNS[name])[row] = np.nan if value is None else value
+        else:
+            getattr(self, RACE_COLUMNS[name])[row] = value
+        self.version += 1
+
+
+class RaceBatch:
+    def __init__(self, table, rows):
+        """
+        A fixed selection of rows of a RaceTable, with the parameters of their contested polls precomputed as
+        arrays. Every contested race is drawn in one vectorized call, instead of one truncated normal per race.
+        :param table: RaceTable
+        :param rows: indices of the selected races
+        """
+        self.table = table
+        self.rows = np.asarray(rows, dtype=int)
+        self.version = None
+        self.refresh()
+
+    def refresh(self):
+        # Recompute gathered columns if the table changed since they were last computed
+        if self.version == self.table.version:
+            return self
+        table = self.table
+        rows = self.rows
+
+        self.races = [table.races[row] for row in rows]
+        self.codes = list(table.codes[rows])
+        self.values = table.values[rows]
+        self.turnouts = table.turnouts[rows]
+        self.incumbent_parties = table.incumbent_parties[rows]
+        self.challenger_parties = table.challenger_parties[rows]
+        self.incumbent_scores = table.incumbent_scores[rows]
+        # Uncontested races never use their challenger score, which may not have been looked up
+        self.challenger_scores = np.where(np.isnan(table.challenger_scores[rows]),
+                                          self.incumbent_scores, table.challenger_scores[rows])
+
+        self.contested = table.contested[rows]
+        self.contested_index = np.flatnonzero(self.contested)
+
+        # Same model as Race.norm_vote_count_distribution, for contested races only
+        contested_rows = rows[self.contested_index]
+        n = table.sample_sizes[contested_rows]
+        p = table.incumbent_projected_vote_shares[contested_rows]
+        self.sample_sizes = n
+        self.expected_values = n * p
+        self.stddevs = np.sqrt(n * p * (1 - p))
+        self.a = (0 - self.expected_values) / self.stddevs
+        self.b = (n - self.expected_values) / self.stddevs
+
+        # Bias against republicans
+        republican = PARTIES.index('R')
+        self.bias_signs = np.where(self.incumbent_parties[self.contested_index] == republican, -1.0, 1.0)
+
+        # Predicted votes of each seat's incumbent and challenger, by vote
+        self.seat_votes = {}
+        self.version = table.version
+        return self
+
+    def simulate_base_shares(self, n_sims, random_state=None):
+        # Incumbent vote share of every contested race before the national bias, one row per simulation
+        self.refresh()
+        if not len(self.contested_index):
+            return np.empty((n_sims, 0))
+        norm_counts = truncnorm.rvs(self.a, self.b, size=(n_sims, len(self.a)), random_state=random_state)
+        counts = norm_counts * self.stddevs + self.expected_values
+        return counts / self.sample_sizes
+
+    def simulate_vote_shares(self, biases, random_state=None):
+        # Incumbent vote share of every contested race, one row per bias, or per row of biases of each race
+        self.refresh()
+        biases = np.asarray(biases, dtype=float)
+        biases = biases[:, self.contested_index] if biases.ndim == 2 else biases.reshape(-1, 1)
+        return self.simulate_base_shares(len(biases), random_state) + self.bias_signs * biases
+
+    def incumbent_wins(self, shares):
+        # Uncontested races always go to the incumbent
+        wins = np.ones((len(shares), len(self.rows)), dtype=bool)
+        wins[:, self.contested_index] = shares >= 0.5
+        return wins
+
+    def simulate_scores(self, biases, random_state=None):
+        wins = self.incumbent_wins(self.simulate_vote_shares(biases, random_state))
+        return np.where(wins[..., np.newaxis], self.incumbent_scores, self.challenger_scores)
+
+    def predict_seat_votes(self, vote, extra_scores=None):
+        """
+        Split a chamber vote into a frozen part, from uncontested seats and any extra voters, and the votes each
+        contested seat casts depending on who wins it. Both are computed once per vote and cached.
+        :param vote: ChamberVote
+        :param extra_scores: scores of voters outside of these races, e.g. the vice president
+        :return: frozen vote total, and incumbent and challenger votes of every contested seat
+        """
+        self.refresh()
+        extra_scores = np.zeros((0, 2)) if extra_scores is None else np.asarray(extra_scores, dtype=float)
+        key = (vote, extra_scores.tobytes())
+        if key not in self.seat_votes:
+            frozen_scores = np.concatenate((self.incumbent_scores[~self.contested], extra_scores.reshape(-1, 2)))
+            contested_scores = np.stack((self.incumbent_scores[self.contested_index],
+                                         self.challenger_scores[self.contested_index]))
+            frozen_result = vote.get_results(frozen_scores[np.newaxis])[0] if len(frozen_scores) else 0
+            incumbent_votes, challenger_votes = (vote.get_results(contested_scores[:, :, np.newaxis])
+                                                 if len(self.contested_index) else np.zeros((2, 0), dtype=int))
+            self.seat_votes[key] = (frozen_result, incumbent_votes, challenger_votes)
+        return self.seat_votes[key]
+
+    def simulate_results(self, biases, vote, extra_scores=None, random_state=None):
+        # Vote margin of the chamber for each bias, only sampling its contested seats
+        return self.results(self.simulate_vote_shares(biases, random_state) >= 0.5, vote, extra_scores)
+
+    def results(self, wins, vote, extra_scores=None):
+        # Vote margin of the chamber, given which contested seats the incumbents won
+        frozen_result, incumbent_votes, challenger_votes = self.predict_seat_votes(vote, extra_scores)
+        return frozen_result + np.where(wins, incumbent_votes, challenger_votes).sum(axis=1)
+
+    def simulate_pivots(self, biases, vote, extra_scores=None, random_state=None):
+        """
+        Vote margin of the chamber for each bias, as in simulate_results, and which seats are pivotal: flipping the
+        seat to its other candidate would change whether the vote passes. Every seat's counterfactual margin is the
+        margin with that seat's vote swapped, so no vote is predicted again.
+        :param biases: national biases against republicans, or biases of each race
+        :param vote: ChamberVote
+        :param extra_scores: scores of voters outside of these races, e.g. the vice president
+        :param random_state: numpy Generator to draw from, defaults to the global random state
+        :return: array of vote margins, and (biases, seats) booleans, always False for uncontested seats
+        """
+        return self.pivots(self.simulate_vote_shares(biases, random_state) >= 0.5, vote, extra_scores)
+
+    def pivots(self, wins, vote, extra_scores=None):
+        # Vote margins and pivotal seats, see simulate_pivots, given which contested seats the incumbents won
+        frozen_result, incumbent_votes, challenger_votes = self.predict_seat_votes(vote, extra_scores)
+        seat_votes = np.where(wins, incumbent_votes, challenger_votes)
+        margins = frozen_result + seat_votes.sum(axis=1)
+
+        flipped_margins = margins[:, np.newaxis] - seat_votes + np.where(wins, challenger_votes, incumbent_votes)
+        pivots = np.zeros((len(margins), len(self.rows)), dtype=bool)
+        pivots[:, self.contested_index] = (flipped_margins > 0) != (margins[:, np.newaxis] > 0)
+        return margins, pivots
+
+    def incumbent_win_probabilities(self, biases):
+        # Probability that the incumbent of every contested race wins, one row per bias
+        self.refresh()
+        biases = np.asarray(biases, dtype=float).reshape(-1, 1)
+        thresholds = (0.5 - self.bias_signs * biases) * self.sample_sizes
+        return truncnorm.sf((thresholds - self.expected_values) / self.stddevs, self.a, self.b)
+
+    def result_distributions(self, biases, vote, extra_scores=None):
+        """
+        Exact distribution of the chamber vote margin for each bias.
+        Given the bias, seats are independent, so the number of contested seats voting yea is a Poisson binomial
+        variable, built up one seat at a time.
+        :param biases: national biases against republicans
+        :param vote: ChamberVote
+        :param extra_scores: scores of voters outside of these races, e.g. the vice president
+        :return: possible vote margins, and their probabilities for each bias
+        """
+        frozen_result, yea_probabilities = self.yea_probabilities(biases, vote, extra_scores)
+        n_seats = len(self.contested_index)
+        margins = frozen_result + 2 * np.arange(n_seats + 1) - n_seats
+        return margins, self.poisson_binomial(yea_probabilities)
+
+    def pivot_probability(self, vote, bias_sd, extra_scores=None):
+        """
+        Exact probability that the chamber vote is decided by a single vote, i.e. a margin of 1 or -1, integrating
+        result_distributions over a normal national bias.
+        :param vote: ChamberVote
+        :param bias_sd: standard deviation of the national bias against republicans
+        :param extra_scores: scores of voters outside of these races, e.g. the vice president
+        :return: probability
+        """
+        def pivot_probabilities(biases):
+            margins, distributions = self.result_distributions(biases, vote, extra_scores)
+            return distributions[:, np.abs(margins) == 1].sum(axis=1)
+
+        return integrate_over_bias(pivot_probabilities, bias_sd)
+
+    def yea_probabilities(self, biases, vote, extra_scores=None):
+        # Frozen vote total, and probability that each contested seat votes yea, one row per bias
+        frozen_result, incumbent_votes, challenger_votes = self.predict_seat_votes(vote, extra_scores)
+        win_probabilities = self.incumbent_win_probabilities(biases)
+        return frozen_result, (win_probabilities * (incumbent_votes > 0)
+                               + (1 - win_probabilities) * (challenger_votes > 0))
+
+    @staticmethod
+    def poisson_binomial(yea_probabilities):
+        # Distribution of the number of yea seats, one row per row of probabilities
+        n_seats = yea_probabilities.shape[1]
+        distributions = np.zeros((len(yea_probabilities), n_seats + 1))
+        distributions[:, 0] = 1
+        for seat in range(n_seats):
+            p = yea_probabilities[:, seat:seat + 1]
+            distributions[:, 1:seat + 2] = distributions[:, 1:seat + 2] * (1 - p) + distributions[:, :seat + 1] * p
+            distributions[:, 0] *= 1 - p[:, 0]
+        return distributions
+
+    def simulate_parties(self, biases, vote, random_state=None):
+        # Margin and party code of the winner of every race, one row per bias
+        shares = self.simulate_vote_shares(biases, random_state)
+        margins = np.ones(shares.shape[:1] + (len(self.rows),))
+        margins[:, self.contested_index] = np.abs(shares - 0.5)
+        return margins, self.winning_parties(shares, vote)
+
+    def winning_parties(self, shares, vote):
+        # Party code of the winner of every race, given the incumbent vote shares of the contested ones
+        wins = self.incumbent_wins(shares)
+        incumbent_parties = self.resolve_parties(self.incumbent_parties, self.incumbent_scores, vote)
+        challenger_parties = self.resolve_parties(self.challenger_parties, self.challenger_scores, vote)
+        return np.where(wins, incumbent_parties, challenger_parties)
+
+    def tipping_point_probabilities(self, order=QUADRATURE_ORDER, width=QUADRATURE_WIDTH):
+        """
+        Same expectation as Race.tipping_point_probability, for every race at once, on a fixed Gauss-Legendre grid.
+        binom.pmf(ceil(n/2), n, p) is only non-negligible within a few standard deviations of p = 0.5, so the grid
+        covers that window (clipped to the truncation bounds) rather than the whole truncated normal.
+        :param order: number of quadrature nodes
+        :param width: half-width of the window, in binomial standard deviations
+        :return: one probability per race, zero when uncontested
+        """
+        self.refresh()
+        probabilities = np.zeros(len(self.rows))
+        if not len(self.contested_index):
+            return probabilities
+
+        nodes, weights = np.polynomial.legendre.leggauss(order)
+        n = self.sample_sizes
+        turnouts = self.turnouts[self.contested_index]
+
+        # Window around an even split, in normalized vote count units
+        center = (0.5 * n - self.expected_values) / self.stddevs
+        half_width = width * np.sqrt(0.25 / turnouts) * n / self.stddevs
+        lower = np.maximum(center - half_width, self.a)
+        upper = np.minimum(center + half_width, self.b)
+
+        midpoints = ((lower + upper) / 2)[:, np.newaxis]
+        radii = ((upper - lower) / 2)[:, np.newaxis]
+        norm_counts = midpoints + radii * nodes
+        p = (norm_counts * self.stddevs[:, np.newaxis] + self.expected_values[:, np.newaxis]) / n[:, np.newaxis]
+
+        log_integrand = (
+            binom.logpmf(np.ceil(turnouts / 2)[:, np.newaxis], turnouts[:, np.newaxis], p)
+            + truncnorm.logpdf(norm_counts, self.a[:, np.newaxis], self.b[:, np.newaxis])
+        )
+        probabilities[self.contested_index] = radii[:, 0] * (np.exp(log_integrand) @ weights)
+        return probabilities
+
+    def adaptive_tipping_point_probabilities(self, width=QUADRATURE_WIDTH):
+        """
+        Same expectation as tipping_point_probabilities, race by race, with adaptive quadrature over the whole
+        truncated normal. Breakpoints at an even split and at the edges of the window around it keep the integrator
+        from stepping over the binomial peak, so this is a slow reference for the other modes.
+        :param width: half-width of the window, in binomial standard deviations
+        :return: one probability per race, zero when uncontested
+        """
+        self.refresh()
+        probabilities = np.zeros(len(self.rows))
+        n = self.sample_sizes
+        turnouts = self.turnouts[self.contested_index]
+        center = (0.5 * n - self.expected_values) / self.stddevs
+        half_width = width * np.sqrt(0.25 / turnouts) * n / self.stddevs
+        log_normalizations = np.log(np.where(self.a > 0, ndtr(-self.a) - ndtr(-self.b), ndtr(self.b) - ndtr(self.a)))
+
+        k = np.ceil(turnouts / 2)
+        log_even_pmfs = binom.logpmf(k, turnouts, 0.5)
+
+        for i, row in enumerate(self.contested_index):
+            def integrand(norm_count):
+                # Same integrand as tipping_point_probabilities, with the log densities written out for speed.
+                # The binomial is taken relative to an even split, which keeps its precision near the peak
+                margin = 2 * (norm_count * self.stddevs[i] + self.expected_values[i]) / n[i] - 1
+                log_pmf = log_even_pmfs[i] + xlog1py(k[i], margin) + xlog1py(turnouts[i] - k[i], -margin)
+                log_density = -norm_count ** 2 / 2 - np.log(2 * np.pi) / 2 - log_normalizations[i]
+                return np.exp(log_pmf + log_density)
+
+            points = [point for point in (center[i] - half_width[i], center[i], center[i] + half_width[i])
+                      if self.a[i] < point < self.b[i]]
+            probabilities[row] = quad(integrand, self.a[i], self.b[i], points=points or None, epsabs=0,
+                                      epsrel=1e-10, limit=500)[0]
+        return probabilities
+
+    def analytic_tipping_point_probabilities(self):
+        """
+        Closed form approximation of tipping_point_probabilities for large turnouts.
+        As a function of p, binom.pmf(k, n, p) is a Beta(k + 1, n - k + 1) density divided by n + 1, which is close
+        to a normal density. Its product with the (normal) projected vote share integrates to a normal density of
+        the difference of their means, corrected for the truncation of both to [0, 1]. On the bundled polls, it
+        stays within about 1e-7 of the quadrature and adaptive modes, relative to them, see Country.tipping_point_error.
+        :return: one probability per race, zero when uncontested
+        """
+        self.refresh()
+        probabilities = np.zeros(len(self.rows))
+        if not len(self.contested_index):
+            return probabilities
+
+        turnouts = self.turnouts[self.contested_index]
+        k = np.ceil(turnouts / 2)
+
+        # Projected vote share, before truncation
+        mean = self.expected_values / self.sample_sizes
+        var = (self.stddevs / self.sample_sizes) ** 2
+        # Moments of the Beta density proportional to binom.pmf(k, n, p)
+        binom_mean = (k + 1) / (turnouts + 2)
+        binom_var = binom_mean * (1 - binom_mean) / (turnouts + 3)
+
+        # Product of both normal densities, restricted to [0, 1]
+        total_var = var + binom_var
+        product_mean = (mean * binom_var + binom_mean * var) / total_var
+        product_sd = np.sqrt(var * binom_var / total_var)
+        truncation = ndtr((1 - product_mean) / product_sd) - ndtr((0 - product_mean) / product_sd)
+
+        # Normalization of the truncated normal
+        normalization = np.where(self.a > 0, ndtr(-self.a) - ndtr(-self.b), ndtr(self.b) - ndtr(self.a))
+
+        log_probabilities = norm.logpdf(binom_mean, mean, np.sqrt(total_var)) - np.log(turnouts + 1)
+        probabilities[self.contested_index] = np.exp(log_probabilities) * truncation / normalization
+        return probabilities
+
+    @staticmethod
+    def resolve_parties(parties, scores, vote):
+        # Independents side with whichever party the vote predicts for them
+        parties = parties.copy()
+        for i in np.flatnonzero(parties == PARTIES.index('I')):
+            republican = vote.get_result(scores[i].reshape(1, -1)) > 0
+            parties[i] = PARTIES.index('R' if republican else 'D')
+        return parties
@@ -0,0 +1,156 @@
+import json
+import os
+import pickle
+import threading
+
+from collections import Counter
+from fingerprint import file_stat, file_digest
+
+# Default size limit of a result cache, in bytes
+RESULT_CACHE_SIZE = 256 * 2 ** 20
+
+# What a cached call may do: 'use' returns a cached result if there is one, 'refresh' recomputes and replaces it,
+# 'bypass' computes without reading or writing the cache
+CACHE_MODES = ('use', 'refresh', 'bypass')
+
+
+class ResultCache:
+    def __init__(self, path, max_bytes=RESULT_CACHE_SIZE):
+        """
+        Results stored on disk under the hash of everything they depend on, so that equal inputs never compute
+        twice, across processes and restarts. Once the cache grows past max_bytes, the least recently used
+        results are removed.
+        :param path: cache directory, created when needed
+        :param max_bytes: size limit of the stored results
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.digests_path = os.path.join(path, 'digests.json')
+        self.digests = None
+        self.lookups = Counter()
+        # Hashes of files are shared by every thread using the cache
+        self.digests_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be sent to worker processes, each process gets its own
+        state = self.__dict__.copy()
+        del state['digests_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.digests_lock = threading.Lock()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """
+        Cached result of a key.
+
+        :param key: hash of the inputs
+        :return: whether there was a result, and the result
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # Modification time is the last use, for eviction
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.lookups['misses'] += 1
+            return False, None
+        self.lookups['hits'] += 1
+        return True, value
+
+    def put(self, key, value):
+        path = self.entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so that readers never see a partial file
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError:
+            # Read-only cache directories just don't store results
+            return
+        self.evict()
+
+    def evict(self):
+        # Remove least recently used results until the cache fits in max_bytes
+        entries = []
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    size, mtime = file_stat(path)
+                    entries.append((mtime, size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def call(self, key, compute, mode='use'):
+        """
+        Result of compute(), cached under key.
+
+        :param key: hash of everything the result depends on
+        :param compute: function computing the result
+        :param mode: one of CACHE_MODES
+        :return: result
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Unknown cache mode: {mode}')
+        if mode == 'use':
+            found, value = self.get(key)
+            if found:
+                return value
+        value = compute()
+        if mode != 'bypass':
+            self.put(key, value)
+        return value
+
+    def file_digests(self, paths):
+        """
+        Hashes of files' contents, only read again when a file's size or modification time changed.
+        Hashes are kept in the cache directory, so that they survive restarts.
+
+        :param paths:
+        :return: list of hex digests
+        """
+        with self.digests_lock:
+            if self.digests is None:
+                try:
+                    with open(self.digests_path) as f:
+                        self.digests = json.load(f)
+                except (OSError, ValueError):
+                    self.digests = {}
+
+            digests = []
+            changed = False
+            for path in paths:
+                stat = list(file_stat(path))
+                known = self.digests.get(path)
+                if known is None or known[:2] != stat:
+                    self.digests[path] = stat + [file_digest(path)]
+                    changed = True
+                digests.append(self.digests[path][2])
+            if changed:
+                self.save_digests()
+            return digests
+
+    def save_digests(self):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            temp_path = self.digests_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.digests, f)
+            os.replace(temp_path, self.digests_path)
+        except OSError:
+            pass
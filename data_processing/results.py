@@ -0,0 +1,179 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+from definitions import PARTIES
+
+# Races shared by every chunk of a run
+RACES_FILE = 'races.npz'
+
+
+class GovernmentResults:
+    def __init__(self, country, path, chunk_size=10000):
+        """
+        Columnar sink for simulated governments: one row per election, one column per race of the race table.
+        Rows are filled in place in preallocated buffers and written to path as one .npz file per chunk_size
+        elections, so that any number of elections can be simulated in bounded memory.
+        :param country: Country
+        :param path: directory of the chunk files, created if needed
+        :param chunk_size: number of elections per chunk file
+        """
+        table = country.race_table
+        self.path = path
+        self.chunk_size = chunk_size
+        self.n_races = len(table)
+        self.n_chunks = 0
+        self.n_sims = 0
+
+        self.biases = np.empty(chunk_size, dtype=np.float32)
+        self.parties = np.empty((chunk_size, self.n_races), dtype=np.int8)
+        self.margins = np.empty((chunk_size, self.n_races), dtype=np.float32)
+        self.filled = 0
+
+        # Each race is written once, elections only refer to it by column
+        os.makedirs(path, exist_ok=True)
+        for old_chunk in glob.glob(os.path.join(path, 'chunk_*.npz')):
+            os.remove(old_chunk)
+        state_names = np.array([state.name for state in country.states])
+        np.savez(
+            os.path.join(path, RACES_FILE),
+            chambers=table.chambers.astype(str),
+            states=state_names[table.state_indices].astype(str),
+            codes=table.codes.astype(str),
+            values=table.values
+        )
+
+    def append(self, biases, margins, parties):
+        """
+        Add a batch of simulated elections, flushing every full chunk to disk.
+
+        :param biases: one bias per election
+        :param margins: (elections, races) winning margins
+        :param parties: (elections, races) party codes of the winners
+        :return:
+        """
+        start = 0
+        while start < len(biases):
+            n = min(self.chunk_size - self.filled, len(biases) - start)
+            rows = slice(self.filled, self.filled + n)
+            self.biases[rows] = biases[start:start + n]
+            self.margins[rows] = margins[start:start + n]
+            self.parties[rows] = parties[start:start + n]
+            self.filled += n
+            start += n
+            if self.filled == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if not self.filled:
+            return
+        np.savez(
+            os.path.join(self.path, f'chunk_{self.n_chunks:06d}.npz'),
+            biases=self.biases[:self.filled],
+            margins=self.margins[:self.filled],
+            parties=self.parties[:self.filled]
+        )
+        self.n_chunks += 1
+        self.n_sims += self.filled
+        self.filled = 0
+
+    def close(self):
+        self.flush()
+        return GovernmentResultsReader(self.path)
+
+
+class GovernmentResultsReader:
+    def __init__(self, path):
+        """
+        Read back the elections of a GovernmentResults directory, one chunk file at a time.
+        :param path: directory written by GovernmentResults
+        """
+        self.path = path
+        self.chunk_paths = sorted(glob.glob(os.path.join(path, 'chunk_*.npz')))
+        with np.load(os.path.join(path, RACES_FILE)) as races:
+            self.chambers = pd.Categorical(races['chambers'])
+            self.states = pd.Categorical(races['states'])
+            self.codes = pd.Categorical(races['codes'])
+            self.values = races['values']
+
+    def __len__(self):
+        return sum(len(chunk['biases']) for chunk in self.iter_chunks(names=('biases',)))
+
+    def columns(self, chamber=None, code=None):
+        # Columns of the races matching a chamber and/or code
+        selected = np.ones(len(self.codes), dtype=bool)
+        if chamber is not None:
+            selected &= np.asarray(self.chambers == chamber)
+        if code is not None:
+            selected &= np.asarray(self.codes == code)
+        return np.flatnonzero(selected)
+
+    def iter_chunks(self, names=('biases', 'margins', 'parties'), columns=None):
+        """
+        Arrays of every chunk, in order.
+
+        :param names: arrays to read
+        :param columns: races to keep, or None for all
+        :return: iterator of dictionaries of array name to array
+        """
+        for chunk_path in self.chunk_paths:
+            with np.load(chunk_path) as chunk:
+                arrays = {name: chunk[name] for name in names}
+            if columns is not None:
+                arrays = {name: array if array.ndim == 1 else array[:, columns] for name, array in arrays.items()}
+            yield arrays
+
+    def race(self, code, chamber=None):
+        """
+        Every simulated result of a single race.
+
+        :param code: race code
+        :param chamber: chamber of the race, needed when codes are shared across chambers
+        :return: DataFrame with one row per election, of the bias, winning party and margin
+        """
+        columns = self.columns(chamber, code)
+        if len(columns) != 1:
+            raise KeyError(f'{len(columns)} races match chamber {chamber} and code {code}')
+        chunks = list(self.iter_chunks(columns=columns))
+        return pd.DataFrame({
+            'bias': np.concatenate([chunk['biases'] for chunk in chunks]),
+            'party': np.array(PARTIES)[np.concatenate([chunk['parties'][:, 0] for chunk in chunks])],
+            'margin': np.concatenate([chunk['margins'][:, 0] for chunk in chunks])
+        })
+
+    def seat_counts(self, chamber, party='D'):
+        # Seats (or electoral votes) won by a party in every election
+        columns = self.columns(chamber)
+        values = self.values[columns]
+        party_code = PARTIES.index(party)
+        return np.concatenate([
+            (chunk['parties'] == party_code) @ values
+            for chunk in self.iter_chunks(names=('parties',), columns=columns)
+        ])
+
+    def to_frame(self, chunk=0):
+        """
+        One chunk in the long format of Country.simulate_government_batch, with categorical race labels.
+
+        :param chunk: index of the chunk
+        :return: DataFrame with one row per race per election
+        """
+        first_sim = 0
+        for chunk_path in self.chunk_paths[:chunk]:
+            with np.load(chunk_path) as arrays:
+                first_sim += len(arrays['biases'])
+        with np.load(self.chunk_paths[chunk]) as arrays:
+            margins = arrays['margins']
+            parties = arrays['parties']
+        n_sims, n_races = margins.shape
+        races = np.tile(np.arange(n_races), n_sims)
+        return pd.DataFrame({
+            'sim': np.repeat(np.arange(first_sim, first_sim + n_sims), n_races),
+            'chamber': self.chambers[races],
+            'state': self.states[races],
+            'code': self.codes[races],
+            'party': pd.Categorical.from_codes(parties.ravel(), PARTIES),
+            'value': self.values[races],
+            'margin': margins.ravel()
+        })
@@ -0,0 +1,143 @@
+import numpy as np
+
+from collections import defaultdict
+from definitions import PARTIES
+from race_table import TABLE_COLUMNS
+
+# Race parameters a scenario can patch, and their table columns
+SCENARIO_COLUMNS = {
+    'incumbent_projected_vote_share': 'incumbent_projected_vote_shares',
+    'sample_size': 'sample_sizes',
+    'turnout': 'turnouts',
+    'incumbent_score': 'incumbent_scores',
+    'challenger_score': 'challenger_scores'
+}
+
+
+class Scenario:
+    def __init__(self, name=None):
+        """
+        A what-if over a Country's races, e.g. "NC Senate polls move 3 points", kept as patches of race parameters
+        rather than edits of the races themselves. See Country.evaluate_scenarios.
+        :param name: label of the scenario in results
+        """
+        self.name = name
+        self.patches = defaultdict(dict)
+        self.shifts = defaultdict(float)
+
+    def patch(self, chamber, code, **params):
+        """
+        Replace parameters of a race, e.g. patch('house', 'ME2', challenger_score=[-0.3, 0.1]).
+        Patching the projected share or sample size of an uncontested race makes it contested, against an unnamed
+        challenger of the challenger party unless challenger_score is patched too.
+
+        :param chamber: 'ec', 'house' or 'senate'
+        :param code: race code
+        :param params: new values, by name in SCENARIO_COLUMNS
+        :return: this scenario, so that patches can be chained
+        """
+        unknown = set(params) - set(SCENARIO_COLUMNS)
+        if unknown:
+            raise ValueError(f'Cannot patch {", ".join(sorted(unknown))}')
+        self.patches[chamber, code].update(params)
+        return self
+
+    def shift_polls(self, chamber, code, shift):
+        """
+        Move the polls of a contested race toward democrats, with the same sign as the national bias.
+
+        :param chamber: 'ec', 'house' or 'senate'
+        :param code: race code
+        :param shift: change of vote share, e.g. 0.03 for 3 points toward democrats
+        :return: this scenario, so that patches can be chained
+        """
+        self.shifts[chamber, code] += shift
+        return self
+
+    def overlay(self, table):
+        return ScenarioTable(table, self)
+
+
+class ScenarioTable:
+    def __init__(self, base, scenario):
+        """
+        A RaceTable as seen by a scenario. Columns the scenario doesn't patch are the base table's own arrays, and
+        patched columns are copied on first write, so a scenario costs a few columns rather than a Country.
+        The overlay reflects the base table as it was when the overlay was made.
+        :param base: RaceTable
+        :param scenario: Scenario
+        """
+        self.base = base
+        self.version = base.version
+        self.patched_columns = set()
+
+        patched_rows = set()
+        republican = PARTIES.index('R')
+        for chamber, code in dict.fromkeys(list(scenario.patches) + list(scenario.shifts)):
+            rows = np.flatnonzero((base.chambers == chamber) & (base.codes == code))
+            if not len(rows):
+                raise KeyError(f'No {chamber} race {code}')
+            row = rows[0]
+            patched_rows.add(row)
+
+            params = scenario.patches.get((chamber, code), {})
+            for name, value in params.items():
+                self.column(SCENARIO_COLUMNS[name])[row] = np.nan if value is None else value
+            if {'incumbent_projected_vote_share', 'sample_size'} & set(params):
+                self.column('contested')[row] = True
+                if np.isnan(self.challenger_scores[row]).any():
+                    # Uncontested races have no challenger score
+                    self.column('challenger_scores')[row] = self.default_challenger_score(row)
+
+            shift = scenario.shifts.get((chamber, code))
+            if shift:
+                if not self.contested[row]:
+                    raise ValueError(f'Cannot shift the polls of uncontested {chamber} race {code}')
+                sign = -1 if base.incumbent_parties[row] == republican else 1
+                self.column('incumbent_projected_vote_shares')[row] += sign * shift
+
+            if self.contested[row] and not (self.sample_sizes[row] > 0
+                                            and 0 < self.incumbent_projected_vote_shares[row] < 1):
+                raise ValueError(f'{chamber} race {code} needs a sample size and a share between 0 and 1')
+        self.patched_rows = np.array(sorted(patched_rows), dtype=int)
+
+    def __getattr__(self, name):
+        # Anything not patched is the base table's
+        if name == 'base':
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def __len__(self):
+        return len(self.base)
+
+    def default_challenger_score(self, row):
+        # Score of an unnamed challenger of the race's challenger party
+        race = self.base.races[row]
+        if getattr(race, 'official_scorer', None) is None:
+            raise ValueError(f'{self.base.chambers[row]} race {self.base.codes[row]} is newly contested, '
+                             f'patch its challenger_score')
+        return race.official_scorer.get_score(('_', PARTIES[self.base.challenger_parties[row]]), self.base.codes[row])
+
+    def column(self, name):
+        # Writable copy of a column, made on first write
+        if name not in self.patched_columns:
+            setattr(self, name, getattr(self.base, name).copy())
+            self.patched_columns.add(name)
+        return getattr(self, name)
+
+
+class StackedRows:
+    def __init__(self, parts):
+        """
+        Rows of several tables, e.g. the patched rows of many scenarios, gathered into one table so that a
+        RaceBatch evaluates all of them at once.
+        :param parts: list of (table, rows)
+        """
+        self.version = 0
+        self.races = [table.races[row] for table, rows in parts for row in rows]
+        for name in TABLE_COLUMNS:
+            columns = [getattr(table, name)[rows] for table, rows in parts]
+            setattr(self, name, np.concatenate(columns) if columns else np.zeros(0))
+
+    def __len__(self):
+        return len(self.races)
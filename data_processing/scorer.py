@@ -1,84 +1,177 @@
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from functools import partial
 import numpy as np
 import pandas as pd
 import os
-import math
+
+from definitions import CACHE_DIR
+from fingerprint import file_stat, file_digest, save_arrays
+
+# Columns of the VoteView member file that are actually used
+SCORE_COLUMNS = ['congress', 'icpsr', 'state_abbrev', 'party_code', 'bioname', 'nominate_dim1', 'nominate_dim2']
+SCORE_DTYPES = {'state_abbrev': str, 'bioname': str, 'nominate_dim1': float, 'nominate_dim2': float}
+
+# Bump when the layout of the cache file changes
+SCORES_CACHE_VERSION = 1
+
+# Number of (name, party, state) lookups remembered by get_score
+RESOLVED_SCORES_SIZE = 4096
 
 class Scorer:
 
-    def __init__(self, data_dir_name: str=None):
-        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),data_dir_name)
-        self.scores_df = pd.read_csv(os.path.join(data_dir_name,'scores.csv'))
-        self.scores_df = self.scores_df[self.scores_df.congress >= 107]
+    def __init__(self, data_dir_name: str=None, use_cache=True, tables=None):
+        self.scores_path = os.path.join(data_dir_name, 'scores.csv')
+        self.cache_path = os.path.join(data_dir_name, CACHE_DIR, 'scores.npz')
 
-        self.mean_d_scores = defaultdict(lambda: np.zeros(2))
-        self.mean_r_scores = defaultdict(lambda: np.zeros(2))
-        self.mean_scores = defaultdict(lambda: np.zeros(2))
+        self.mean_d_scores = defaultdict(partial(np.zeros, 2))
+        self.mean_r_scores = defaultdict(partial(np.zeros, 2))
+        self.mean_scores = defaultdict(partial(np.zeros, 2))
 
         self.official_scores = {}
-        self.init_scores()
-
-    def init_scores(self):
-        d_total = defaultdict(lambda: 0)
-        r_total = defaultdict(lambda: 0)
-        total = defaultdict(lambda: 0)
-        for index, row in self.scores_df.iterrows():
-            # Make sure score is valid
-            score = np.array([float(row['nominate_dim1']), float(row['nominate_dim2'])])
-            if math.isnan(score[0]) or math.isnan(score[1]):
-                continue
+        self.init_scores(use_cache, tables)
+        self.init_surname_index()
 
-            # Get state and party information
-            state = row['state_abbrev']
-            party = 'I'
-            if row['party_code'] == 200:
-                party = 'R'
-            elif row['party_code'] == 100:
-                party = 'D'
-
-            # Update member score
-            if row['congress'] >= 102:
-                official_id = row['bioname'].split(',')[0].lower() + '_' + state + '_' + party
-                self.official_scores[official_id] = score
-                self.official_scores[row['icpsr']] = score
-            else:
-                continue
+        # Bounded memo of get_score, and how lookups were answered: memo hits and misses,
+        # and whether the politician's own score was found ('official') or a state mean was used ('fallback')
+        self.resolved_scores = OrderedDict()
+        self.score_lookups = Counter()
 
-            # Update estimate scores
-            if row['party_code'] == 200:
-                r_total[state] += 1
-                delta = score - self.mean_r_scores[state]
-                self.mean_r_scores[state] += delta / r_total[state]
-            elif row['party_code'] == 100:
-                d_total[state] += 1
-                delta = score - self.mean_d_scores[state]
-                self.mean_d_scores[state] += delta / d_total[state]
+    def init_scores(self, use_cache=True, tables=None):
+        """
+        Read member scores, from the cache if scores.csv hasn't changed since it was written.
 
-            total[state] += 1
-            delta = score - self.mean_scores[state]
-            self.mean_scores[state] += delta / total[state]
+        :param use_cache: read and write the cache file
+        :param tables: already parsed tables, e.g. from a Country snapshot
+        :return:
+        """
+        if tables is None:
+            size, mtime = file_stat(self.scores_path)
+            tables = self.read_cache(size, mtime) if use_cache else None
+            if tables is None:
+                tables = self.parse_scores()
+                if use_cache:
+                    self.write_cache(tables, size, mtime)
+        self.tables = tables
 
-    def get_score(self, politician, code):
-        name, party = politician
+        self.official_scores.update(zip(tables['official_ids'], tables['official_id_scores']))
+        self.official_scores.update(zip(tables['icpsrs'].tolist(), tables['icpsr_scores']))
+        for party, mean_scores in (('R', self.mean_r_scores), ('D', self.mean_d_scores), ('', self.mean_scores)):
+            mean_scores.update(zip(tables[f'states{party}'], tables[f'means{party}']))
+
+    def parse_scores(self):
+        # Recent members with valid scores only
+        scores_df = pd.read_csv(self.scores_path, usecols=SCORE_COLUMNS, dtype=SCORE_DTYPES)
+        scores_df = scores_df[scores_df.congress >= 107].dropna(subset=['nominate_dim1', 'nominate_dim2'])
+        scores = scores_df[['nominate_dim1', 'nominate_dim2']].to_numpy()
+
+        # Member scores, by official id (e.g. 'scott_FL_R') and by icpsr; later congresses take precedence
+        party = np.select([scores_df.party_code == 200, scores_df.party_code == 100], ['R', 'D'], 'I')
+        official_ids = scores_df.bioname.str.split(',').str[0].str.lower() + '_' + scores_df.state_abbrev + '_' + party
+        official_id_scores = dict(zip(official_ids, scores))
+        icpsr_scores = dict(zip(scores_df.icpsr.to_numpy(), scores))
+
+        tables = {
+            'official_ids': np.array(list(official_id_scores), dtype=str),
+            'official_id_scores': np.array(list(official_id_scores.values())).reshape(-1, 2),
+            'icpsrs': np.array(list(icpsr_scores), dtype=np.int64),
+            'icpsr_scores': np.array(list(icpsr_scores.values())).reshape(-1, 2)
+        }
+
+        # Mean scores by state, for each party and overall
+        everyone = np.ones(len(scores_df), dtype=bool)
+        for name, members in (('R', scores_df.party_code == 200), ('D', scores_df.party_code == 100), ('', everyone)):
+            means = scores_df[members].groupby('state_abbrev')[['nominate_dim1', 'nominate_dim2']].mean()
+            tables[f'states{name}'] = means.index.to_numpy(dtype=str)
+            tables[f'means{name}'] = means.to_numpy().reshape(-1, 2)
+        return tables
+
+    def read_cache(self, size, mtime):
+        # Cached tables, if they were built from the current scores.csv
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as cache:
+                tables = dict(cache)
+            version = tables.pop('version')
+            cached_size = tables.pop('size')
+            cached_mtime = tables.pop('mtime')
+            digest = str(tables.pop('digest'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if version != SCORES_CACHE_VERSION or cached_size != size:
+            return None
+        if cached_mtime != mtime:
+            # A touched but unchanged file is still a hit, with its new mtime recorded
+            if digest != file_digest(self.scores_path):
+                return None
+            self.write_cache(tables, size, mtime, digest)
+        return tables
+
+    def write_cache(self, tables, size, mtime, digest=None):
+        digest = file_digest(self.scores_path) if digest is None else digest
+        save_arrays(self.cache_path, version=SCORES_CACHE_VERSION, size=size, mtime=mtime, digest=digest, **tables)
+
+    def init_surname_index(self):
+        # Official surnames by (last surname token, state, party), e.g. ('drew', 'NJ', 'R') -> {'van drew'}
+        self.surname_index = defaultdict(set)
+        for official_id in self.official_scores:
+            if isinstance(official_id, str):
+                surname, state, party = official_id.rsplit('_', 2)
+                self.surname_index[surname.split(' ')[-1], state, party].add(surname)
+
+    def resolve_score(self, name, party, state):
+        """
+        Find a politician's score, without the memo cache.
+
+        :return: score, and whether it is the politician's own ('official') or a state mean ('fallback')
+        """
         names = name.split(' ')
-        state = code[:2]
+        surnames = self.surname_index.get((names[-1].lower(), state, party), ())
         # Look for each combination of last name tokens in order
         for i in reversed(range(len(names))):
-            official_id = ' '.join(names[i:]).lower() + '_' + state + '_' + party
-            if official_id.startswith('trump'):
+            surname = ' '.join(names[i:]).lower()
+            if surname.startswith('trump'):
                 # Per https://projects.fivethirtyeight.com/congress-trump-score/, Rick Scott is the "Trumpiest Senator"
                 official_id = 'scott_FL_R'
-            elif official_id.startswith('biden'):
+            elif surname.startswith('biden'):
                 official_id = 'biden_DE_D'
+            elif surname in surnames:
+                official_id = surname + '_' + state + '_' + party
+            else:
+                continue
             if official_id in self.official_scores:
-                return self.official_scores[official_id]
+                return self.official_scores[official_id], 'official'
 
         if party == 'R':
-            return self.mean_r_scores[state]
+            return self.mean_r_scores[state], 'fallback'
         elif party == 'D':
-            return self.mean_d_scores[state]
+            return self.mean_d_scores[state], 'fallback'
         else:
-            return self.mean_scores[state]
+            return self.mean_scores[state], 'fallback'
+
+    def get_score(self, politician, code):
+        name, party = politician
+        key = (name, party, code[:2])
+        if key in self.resolved_scores:
+            self.score_lookups['hits'] += 1
+            self.resolved_scores.move_to_end(key)
+        else:
+            self.score_lookups['misses'] += 1
+            self.resolved_scores[key] = self.resolve_score(*key)
+            if len(self.resolved_scores) > RESOLVED_SCORES_SIZE:
+                self.resolved_scores.popitem(last=False)
+
+        score, source = self.resolved_scores[key]
+        self.score_lookups[source] += 1
+        return score
+
+    def get_scores(self, politicians, codes):
+        # Scores of many politicians, as an (n, 2) array
+        return np.array([self.get_score(politician, code) for politician, code in zip(politicians, codes)],
+                        dtype=float).reshape(-1, 2)
 
     def get_icpsr_score(self, icpsr):
         return self.official_scores[icpsr]
+
+    def get_icpsr_scores(self, icpsrs):
+        # (n, 2) array of the scores of several members, e.g. every member of a vote file
+        return np.array([self.get_icpsr_score(icpsr) for icpsr in icpsrs], dtype=float).reshape(-1, 2)
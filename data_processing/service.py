@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from elections import Country
+from simulation import SimulationRunner, VICE_PRESIDENT_SCORE
+from votes import ChamberVote
+
+# Obamacare cost estimate of the Congressional Budget Office, used to value votes
+DEFAULT_COST = 1.33e9
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+
+
+def to_json(value):
+    # Numpy values as plain JSON values
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class VoterPowerService:
+    def __init__(self, data_dir_name='../data', vote_files=('obamacare_senate.csv',), snapshot_path=None,
+                 cache_size=256, max_workers=None, result_cache=False):
+        """
+        Keeps a Country and its ChamberVotes loaded, and answers queries about them from an LRU cache of results.
+        Simulations run on a background thread of their own, and every other query on a second one, so cheap tipping
+        point and exact queries never wait behind a simulation. Tipping point caches are only used by the second
+        thread, and simulations only share seat votes with it, whose cached values are the same whichever thread
+        computes them.
+        :param data_dir_name: data directory, relative to this module as for Country
+        :param vote_files: vote files under <data_dir>/votes, each served by its name without extension
+        :param snapshot_path: Country snapshot to load from, and refresh, or None to always build the Country
+        :param cache_size: number of results kept
+        :param max_workers: number of processes of simulations, or 1 to run them on the background thread
+        :param result_cache: keep results on disk across restarts, see Country.use_result_cache
+        """
+        if snapshot_path is None:
+            self.country = Country(data_dir_name)
+        else:
+            self.country = Country.load_snapshot(snapshot_path, data_dir_name)
+        if result_cache:
+            self.country.use_result_cache()
+        self.votes = {
+            os.path.splitext(vote_file)[0]: ChamberVote(os.path.join(self.country.data_dir, 'votes', vote_file),
+                                                        self.country.official_scorer)
+            for vote_file in vote_files
+        }
+        self.cache_size = cache_size
+        self.max_workers = max_workers
+        # Futures of results by query, so that identical queries in flight share a single computation
+        self.results = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.simulation_executor = ThreadPoolExecutor(max_workers=1)
+        # /health is answered directly, every other path goes through the cache
+        self.routes = {
+            '/races': self.races,
+            '/power': self.power,
+            '/rankings': self.rankings
+        }
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'votes': sorted(self.votes),
+            'cached_results': sum(future.done() for future in self.results.values()),
+            'pending_results': sum(not future.done() for future in self.results.values())
+        }
+
+    def races(self, params):
+        # Tipping point probability of every race of a chamber
+        chamber = params.get('chamber', 'house')
+        if chamber not in ('ec', 'house', 'senate'):
+            raise ValueError(f'Unknown chamber {chamber}')
+        return self.country.tipping_point_probabilities(chamber, params.get('mode', 'quadrature'))
+
+    def power(self, params):
+        """
+        Probability that each chamber's vote comes down to a single vote.
+        method=exact integrates the exact margin distribution, method=simulate runs n_sims seeded elections.
+        """
+        vote = self.vote(params)
+        bias_sd = float(params.get('bias_sd', 0.02))
+        if params.get('method', 'exact') == 'exact':
+            return {
+                'house': self.country.chamber_pivot_probability(vote, 'house', bias_sd),
+                'senate': self.country.chamber_pivot_probability(vote, 'senate', bias_sd, VICE_PRESIDENT_SCORE)
+            }
+        runner = SimulationRunner(self.country, vote, bias_sd=bias_sd, seed=int(params.get('seed', 0)),
+                                  max_workers=self.max_workers)
+        return runner.chamber_power(int(params.get('n_sims', 10000)))
+
+    async def rankings(self, params):
+        # Races of a chamber by value of a vote: tipping point probability * chamber power * cost
+        chamber = params.get('chamber', 'house')
+        if chamber not in ('house', 'senate'):
+            raise ValueError(f'Rankings are only available for the house and senate, not {chamber}')
+        power = await self.query('/power', {key: value for key, value in params.items()
+                                            if key in ('vote', 'bias_sd', 'method', 'seed', 'n_sims')})
+        probabilities = await self.query('/races', {key: value for key, value in params.items()
+                                                    if key in ('chamber', 'mode')})
+        cost = float(params.get('cost', DEFAULT_COST))
+        ranking = sorted(probabilities.items(), key=lambda item: -item[1])[:int(params.get('limit', 20))]
+        return [
+            {'code': code, 'tipping_point_probability': p, 'value_of_vote': p * power[chamber] * cost}
+            for code, p in ranking
+        ]
+
+    @staticmethod
+    def is_simulation(path, params):
+        return path == '/power' and params.get('method', 'exact') != 'exact'
+
+    def vote(self, params):
+        name = params.get('vote', next(iter(self.votes)))
+        if name not in self.votes:
+            raise KeyError(f'Unknown vote {name}')
+        return self.votes[name]
+
+    async def query(self, path, params):
+        """
+        Result of a query, computed at most once per distinct path and parameters.
+
+        :param path: e.g. '/races'
+        :param params: dictionary of query parameters
+        :return: JSON serializable result
+        """
+        handler = self.routes[path]
+        key = (handler.__name__, tuple(sorted(params.items())))
+        if key in self.results:
+            self.results.move_to_end(key)
+            future = self.results[key]
+        else:
+            if inspect.iscoroutinefunction(handler):
+                # Combines other queries, without work of its own
+                future = asyncio.ensure_future(handler(params))
+            else:
+                executor = self.simulation_executor if self.is_simulation(path, params) else self.executor
+                future = asyncio.get_running_loop().run_in_executor(executor, handler, params)
+            self.results[key] = future
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # Failed queries are not cached
+            if self.results.get(key) is future:
+                del self.results[key]
+            raise
+
+    async def handle(self, reader, writer):
+        # One HTTP/1.1 GET request per connection
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request_line) < 2:
+                status, body = 400, {'error': 'Malformed request'}
+            elif request_line[0] != 'GET':
+                status, body = 405, {'error': 'Only GET is supported'}
+            else:
+                url = urlsplit(request_line[1])
+                if url.path == '/health':
+                    status, body = 200, self.health()
+                elif url.path not in self.routes:
+                    status, body = 404, {'error': f'Unknown path {url.path}',
+                                         'paths': ['/health'] + sorted(self.routes)}
+                else:
+                    try:
+                        status, body = 200, await self.query(url.path, dict(parse_qsl(url.query)))
+                    except (KeyError, ValueError) as e:
+                        status, body = 400, {'error': str(e)}
+                    except Exception as e:
+                        status, body = 500, {'error': repr(e)}
+
+            payload = json.dumps(body, default=to_json).encode()
+            writer.write(f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(payload)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve voter power results over HTTP, e.g. '
+                                                 'curl "localhost:8080/rankings?chamber=senate&limit=5"')
+    parser.add_argument('--data', default='../data', help='data directory, relative to data_processing')
+    parser.add_argument('--votes', nargs='+', default=['obamacare_senate.csv'], help='vote files under data/votes')
+    parser.add_argument('--snapshot', default=None, help='Country snapshot directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=None, help='processes of simulations')
+    parser.add_argument('--result-cache', action='store_true', help='keep results on disk under data/.cache')
+    args = parser.parse_args()
+
+    service = VoterPowerService(args.data, args.votes, args.snapshot, args.cache_size, args.workers,
+                                args.result_cache)
+    print(f'Serving on http://{args.host}:{args.port}')
+    asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
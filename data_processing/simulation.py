@@ -0,0 +1,335 @@
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from scipy.stats import norm
+from accumulators import Count, MeanVariance, Histogram, Summary
+from definitions import PARTIES
+
+# Mike Pence's tie-breaking vote in the Senate
+VICE_PRESIDENT_SCORE = np.array([[0.655, 0.088]])
+
+# Voters outside of each chamber's races, unless given others
+DEFAULT_EXTRA_SCORES = {'senate': VICE_PRESIDENT_SCORE}
+
+# Scores of no voter at all, for a chamber vote without extra voters
+NO_EXTRA_SCORES = np.zeros((0, 2))
+
+# Objects shared by every task of a worker process, e.g. its Country and ChamberVote, sent once when it starts
+worker_state = {}
+
+
+def init_worker(state):
+    worker_state.update(state)
+
+
+def _run_worker_chunk(seed, n_sims, bias_sd, chambers, extra_scores):
+    return simulate_chunk(worker_state['country'], worker_state['vote'], seed, n_sims,
+                          bias_sd, chambers, extra_scores)
+
+
+def _summarize_worker_chunk(seed, n_sims, bias_sd, chambers, extra_scores):
+    return summarize_chunk(worker_state['country'], worker_state['vote'], seed, n_sims,
+                           bias_sd, chambers, extra_scores)
+
+
+def _importance_worker_chunk(seed, n_sims, bias_sd, chambers, extra_scores, proposal):
+    return importance_chunk(worker_state['country'], worker_state['vote'], seed, n_sims,
+                            bias_sd, chambers, extra_scores, proposal)
+
+
+def simulate_chunk(country, vote, seed, n_sims, bias_sd, chambers, extra_scores):
+    """
+    Simulate a chunk of elections with its own random stream.
+
+    :param country: Country
+    :param vote: ChamberVote
+    :param seed: SeedSequence of this chunk
+    :param n_sims: number of elections
+    :param bias_sd: standard deviation of the national bias against republicans
+    :param chambers: chambers to simulate, e.g. ('house', 'senate')
+    :param extra_scores: dictionary of chamber to scores of voters outside of its races
+    :return: dictionary of simulated biases and chamber vote margins
+    """
+    rng = np.random.default_rng(seed)
+    results = {'bias': rng.normal(0, bias_sd, n_sims)}
+    for chamber in chambers:
+        results[chamber] = country.simulate_chamber_results(
+            chamber, results['bias'], vote, extra_scores.get(chamber, NO_EXTRA_SCORES), random_state=rng)
+    return results
+
+
+def importance_chunk(country, vote, seed, n_sims, bias_sd, chambers, extra_scores, proposal):
+    """
+    Simulate a chunk of elections with biases drawn from a proposal instead of the national bias distribution.
+    The proposal mixes the normal N(mean, sd) with the national bias distribution, which keeps weights bounded.
+
+    Arguments are the same as simulate_chunk, plus:
+    :param proposal: (mean, sd, defensive_weight), where defensive_weight is the share of the national bias
+                     distribution in the mixture
+    :return: dictionary of simulated biases, their importance weights and chamber vote margins
+    """
+    mean, sd, defensive_weight = proposal
+    rng = np.random.default_rng(seed)
+    nominal = rng.random(n_sims) < defensive_weight
+    biases = np.where(nominal, rng.normal(0, bias_sd, n_sims), rng.normal(mean, sd, n_sims))
+
+    density = norm.pdf(biases, 0, bias_sd)
+    proposal_density = defensive_weight * density + (1 - defensive_weight) * norm.pdf(biases, mean, sd)
+    results = {'bias': biases, 'weight': density / proposal_density}
+    for chamber in chambers:
+        results[chamber] = country.simulate_chamber_results(
+            chamber, biases, vote, extra_scores.get(chamber, NO_EXTRA_SCORES), random_state=rng)
+    return results
+
+
+def summarize_chunk(country, vote, seed, n_sims, bias_sd, chambers, extra_scores):
+    """
+    Simulate a chunk of elections with its own random stream, keeping only aggregates of them:
+    - 'bias': mean and variance of the national bias
+    - '<chamber>_margin': histogram of the chamber's vote margins, and '<chamber>_power' the count of margins of one
+    - '<chamber>_pivots': count of elections in which each of the chamber's seats was pivotal, see
+      Country.simulate_seat_pivotality
+    - 'wins': count of wins of each party in every race of the race table, shape (races, parties)
+    - '<chamber>_seats': histogram of seats (or electoral votes) won by democrats
+    - 'control': count of control of the (house, senate) by democrats, republicans, or neither on a tie
+
+    Arguments are the same as simulate_chunk.
+    :return: Summary
+    """
+    rng = np.random.default_rng(seed)
+    biases = rng.normal(0, bias_sd, n_sims)
+    summary = Summary(bias=MeanVariance().update(biases))
+
+    # Every race is drawn once, so that chamber margins agree with the wins and seats of the same elections
+    government = country.race_batch('government')
+    shares = government.simulate_vote_shares(biases, rng)
+    for chamber in chambers:
+        batch = country.race_batch(chamber)
+        extra = extra_scores.get(chamber)
+        n_votes = len(batch.rows) + (0 if extra is None else len(extra))
+        margins, pivots = batch.pivots(shares[:, country.contested_columns(chamber)] >= 0.5, vote, extra)
+        summary[chamber + '_margin'] = Histogram(-n_votes, n_votes).update(margins)
+        summary[chamber + '_power'] = Count().update(np.abs(margins) == 1)
+        summary[chamber + '_pivots'] = Count(pivots.shape[1:]).update(pivots)
+
+    table = country.race_table
+    parties = government.winning_parties(shares, vote)
+    summary['wins'] = Count((len(table), len(PARTIES))).update(parties[..., np.newaxis] == np.arange(len(PARTIES)))
+
+    controls = []
+    for chamber in ('ec', 'house', 'senate'):
+        rows = table.chambers == chamber
+        seats = [(parties[:, rows] == PARTIES.index(party)) @ table.values[rows] for party in ('D', 'R')]
+        summary[chamber + '_seats'] = Histogram(0, table.values[rows].sum()).update(seats[0])
+        controls.append(np.where(seats[0] > seats[1], 0, np.where(seats[0] < seats[1], 1, 2)))
+    joint = np.zeros((n_sims, 3, 3), dtype=bool)
+    joint[np.arange(n_sims), controls[1], controls[2]] = True
+    summary['control'] = Count((3, 3)).update(joint)
+    return summary
+
+
+class SimulationRunner:
+    def __init__(self, country, vote, bias_sd=0.02, chunk_size=10000, seed=None, max_workers=None,
+                 chambers=('house', 'senate'), extra_scores=None):
+        """
+        Run chamber vote simulations in chunks, each with its own child SeedSequence, over a pool of processes.
+        Results only depend on the seed and chunk size, not on how many workers run them.
+        :param country: Country
+        :param vote: ChamberVote
+        :param bias_sd: standard deviation of the national bias against republicans
+        :param chunk_size: number of elections simulated per task
+        :param seed: seed of the root SeedSequence, drawn from the OS when None
+        :param max_workers: number of processes, or 1 to run in this process
+        :param chambers: chambers to simulate
+        :param extra_scores: dictionary of chamber to scores of voters outside of its races,
+                             defaults to the vice president in the Senate
+        """
+        self.country = country
+        self.vote = vote
+        self.bias_sd = bias_sd
+        self.chunk_size = chunk_size
+        # Keep the entropy so that a run without a seed can be repeated
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.max_workers = max_workers
+        self.chambers = tuple(chambers)
+        self.extra_scores = DEFAULT_EXTRA_SCORES if extra_scores is None else extra_scores
+
+    def chunks(self, n_sims, seed=None):
+        # Child seed and size of every chunk, spawned from the runner's seed unless another SeedSequence is given
+        sizes = [min(self.chunk_size, n_sims - start) for start in range(0, n_sims, self.chunk_size)]
+        seed = np.random.SeedSequence(self.entropy) if seed is None else seed
+        return seed.spawn(len(sizes)), sizes
+
+    def executor(self):
+        # Pool of processes that every batch of a run shares, or a null context when running in this process
+        if self.max_workers == 1:
+            return nullcontext()
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker,
+                                   initargs=({'country': self.country, 'vote': self.vote},))
+
+    def map_chunks(self, function, worker_function, n_sims, chambers=None, seed=None, executor=None):
+        # Results of every chunk, in order, on the given executor or on a pool of their own
+        seeds, sizes = self.chunks(n_sims, seed)
+        n_chunks = len(sizes)
+        chambers = self.chambers if chambers is None else tuple(chambers)
+        args = (seeds, sizes, [self.bias_sd] * n_chunks, [chambers] * n_chunks, [self.extra_scores] * n_chunks)
+
+        if self.max_workers == 1:
+            return [function(self.country, self.vote, *chunk_args) for chunk_args in zip(*args)]
+        if executor is None:
+            with self.executor() as executor:
+                return list(executor.map(worker_function, *args))
+        return list(executor.map(worker_function, *args))
+
+    def cached_result(self, name, params, compute, cache='use'):
+        # Result of compute() from the country's result cache, keyed by everything a run depends on
+        params = (self.vote.digest(), self.bias_sd, self.chunk_size, self.entropy, self.chambers, self.extra_scores,
+                  params)
+        return self.country.cached_result(f'SimulationRunner.{name}', params, compute, cache)
+
+    def run(self, n_sims, cache='use'):
+        """
+        Simulate n_sims elections.
+
+        :param n_sims: number of elections
+        :param cache: 'use', 'refresh' or 'bypass' the country's result cache
+        :return: dictionary of simulated biases and chamber vote margins, one entry per election
+        """
+        return self.cached_result('run', n_sims, lambda: self.concatenate(
+            self.map_chunks(simulate_chunk, _run_worker_chunk, n_sims), ('bias',) + self.chambers
+        ), cache)
+
+    @staticmethod
+    def concatenate(chunks, keys):
+        if not chunks:
+            return {key: np.zeros(0) for key in keys}
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in keys}
+
+    def chamber_power(self, n_sims, cache='use'):
+        # Probability that each chamber's vote comes down to a single vote
+        results = self.run(n_sims, cache)
+        return {chamber: np.mean(np.abs(results[chamber]) == 1) for chamber in self.chambers}
+
+    def summarize(self, n_sims, cache='use'):
+        """
+        Simulate n_sims elections without keeping any of them, see summarize_chunk.
+        Memory only grows with the number of races and bins, and summaries of separate runs can be merged.
+
+        :param n_sims: number of elections
+        :param cache: 'use', 'refresh' or 'bypass' the country's result cache
+        :return: Summary
+        """
+        return self.cached_result('summarize', n_sims, lambda: self.compute_summary(n_sims), cache)
+
+    def compute_summary(self, n_sims):
+        summary = Summary()
+        for chunk in self.map_chunks(summarize_chunk, _summarize_worker_chunk, n_sims):
+            summary.merge(chunk)
+        return summary
+
+    def adaptive_chamber_power(self, rel_se=0.05, ci_width=None, confidence=0.95, initial_sims=10000,
+                               max_sims=1000000):
+        """
+        Chamber power, simulated in batches that double the number of elections until each chamber meets its
+        precision targets. A chamber stops being simulated as soon as it meets them, so chambers that converge
+        quickly do not pay for rare ties elsewhere. Batches draw fresh child seeds of the runner's seed.
+
+        :param rel_se: largest standard error relative to the estimate, or None
+        :param ci_width: largest width of the Wilson interval, or None
+        :param confidence: confidence level of the interval
+        :param initial_sims: number of elections of the first batch
+        :param max_sims: largest number of elections per chamber
+        :return: dictionary of chamber to a dictionary of its 'power', 'standard_error', 'interval', 'n_sims' and
+                 whether it 'converged'
+        """
+        if rel_se is None and ci_width is None:
+            raise ValueError('Need a target relative standard error or interval width')
+
+        root = np.random.SeedSequence(self.entropy)
+        counts = {chamber: Count() for chamber in self.chambers}
+        # Chambers still simulated, which have all been simulated n_sims times
+        active = list(self.chambers)
+        n_sims = 0
+        batch_sims = min(initial_sims, max_sims)
+        with self.executor() as executor:
+            while active:
+                chunks = self.map_chunks(simulate_chunk, _run_worker_chunk, batch_sims, active, root.spawn(1)[0],
+                                         executor)
+                for chamber in active:
+                    for chunk in chunks:
+                        counts[chamber].update(np.abs(chunk[chamber]) == 1)
+                n_sims += batch_sims
+                active = [
+                    chamber for chamber in active
+                    if n_sims < max_sims and not self.power_converged(counts[chamber], rel_se, ci_width, confidence)
+                ]
+                # Double the number of elections so far
+                batch_sims = min(n_sims, max_sims - n_sims)
+
+        return {
+            chamber: {
+                'power': count.probability(),
+                'standard_error': count.standard_error(),
+                'interval': count.interval(confidence),
+                'n_sims': count.n,
+                'converged': self.power_converged(count, rel_se, ci_width, confidence)
+            }
+            for chamber, count in counts.items()
+        }
+
+    @staticmethod
+    def power_converged(count, rel_se, ci_width, confidence):
+        p = count.probability()
+        if rel_se is not None and not (p > 0 and count.standard_error() <= rel_se * p):
+            return False
+        if ci_width is not None:
+            lower, upper = count.interval(confidence)
+            if upper - lower > ci_width:
+                return False
+        return True
+
+    def importance_chamber_power(self, n_sims, pilot_sims=2000, near_tie_fraction=0.05, defensive_weight=0.1):
+        """
+        Chamber power by importance sampling of the national bias. For each chamber, a pilot run finds the biases
+        whose elections come closest to a tie, and the main run draws biases from a normal fitted to them (mixed
+        with the national bias distribution), weighting every election by the ratio of the two densities.
+
+        :param n_sims: number of elections of the main run of each chamber
+        :param pilot_sims: number of elections of the pilot run of each chamber
+        :param near_tie_fraction: share of the pilot elections, closest to a tie, that the proposal is fitted to
+        :param defensive_weight: share of the national bias distribution in the proposal
+        :return: dictionary of chamber to a dictionary of its 'power', 'standard_error', 'effective_sample_size',
+                 'n_sims' (including the pilot) and 'proposal' mean and standard deviation
+        """
+        root = np.random.SeedSequence(self.entropy)
+        estimates = {}
+        with self.executor() as executor:
+            for chamber in self.chambers:
+                pilot_seed, seed = root.spawn(2)
+                pilot = self.concatenate(
+                    self.map_chunks(simulate_chunk, _run_worker_chunk, pilot_sims, (chamber,), pilot_seed,
+                                    executor),
+                    ('bias', chamber)
+                )
+                distances = np.abs(pilot[chamber])
+                near_tie = pilot['bias'][distances <= np.quantile(distances, near_tie_fraction)]
+                # A floor on the width, in case the closest elections all had nearly the same bias
+                proposal = (near_tie.mean(), max(near_tie.std(), 0.1 * self.bias_sd), defensive_weight)
+
+                results = self.concatenate(self.map_chunks(
+                    partial(importance_chunk, proposal=proposal),
+                    partial(_importance_worker_chunk, proposal=proposal),
+                    n_sims, (chamber,), seed, executor
+                ), ('weight', chamber))
+                weights = results['weight']
+                weighted_ties = weights * (np.abs(results[chamber]) == 1)
+                estimates[chamber] = {
+                    'power': weighted_ties.mean(),
+                    'standard_error': weighted_ties.std(ddof=1) / np.sqrt(n_sims),
+                    'effective_sample_size': weights.sum() ** 2 / (weights ** 2).sum(),
+                    'n_sims': pilot_sims + n_sims,
+                    'proposal': proposal[:2]
+                }
+        return estimates
@@ -0,0 +1,192 @@
+import json
+import os
+import numpy as np
+
+from collections import defaultdict
+from definitions import CACHE_DIR, CYCLES
+from fingerprint import file_stat
+from race_table import RaceTable, TABLE_COLUMNS
+
+# Bump when the layout of snapshots changes
+SNAPSHOT_VERSION = 3
+
+# Arrays memory-mapped copy-on-write when a snapshot is loaded, so that forked workers share their pages
+MAPPED_ARRAYS = {'incumbent_scores', 'challenger_scores', 'official_id_scores', 'icpsr_scores'}
+
+# Arrays of strings kept as Python objects in memory
+OBJECT_ARRAYS = {'codes', 'incumbent_names'}
+
+
+def data_fingerprint(data_dir):
+    # Size and modification time of every input file under data_dir, ignoring derived files
+    fingerprint = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if d != CACHE_DIR)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            fingerprint[os.path.relpath(path, data_dir)] = list(file_stat(path))
+    return fingerprint
+
+
+def native_values(dictionary):
+    # Numpy scalars as Python numbers, so that they can be written as JSON
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in dictionary.items()}
+
+
+def save_snapshot(country, path):
+    """
+    Save a built Country as a directory of .npy arrays, plus a JSON file of everything else.
+
+    :param country: Country
+    :param path: snapshot directory
+    :return:
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = dict(country.race_table.columns())
+    arrays.update({'scorer_' + name: table for name, table in country.official_scorer.tables.items()})
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if array.dtype == object:
+            array = array.astype(str)
+        np.save(os.path.join(path, name + '.npy'), array, allow_pickle=False)
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'data_dir': country.data_dir,
+        'cycle': country.cycle,
+        'fingerprint': data_fingerprint(country.data_dir),
+        'arrays': sorted(arrays),
+        'state_codes': country.state_codes,
+        'state_turnouts': native_values(country.state_turnouts),
+        'district_turnouts': native_values(country.district_turnouts),
+        'ec_turnouts': native_values(country.ec_turnouts),
+        'ec_values': native_values(country.ec_values),
+        'senators': country.senators,
+        'representatives': country.representatives,
+        # Everything Country.refresh needs to re-read polls incrementally
+        'races': [
+            {
+                'default_incumbent': race.default_incumbent,
+                'info_dir': race.info_dir,
+                'inferred_status': race.inferred_status
+            }
+            for race in country.race_table.races
+        ],
+        'statuses': country.statuses,
+        'status_polls': {
+            status: [[election, code, float(share), float(sample_size)]
+                     for (election, code), (share, sample_size) in polls.items()]
+            for status, polls in country.status_polls.items()
+        },
+        'poll_files': country.poll_index.poll_files,
+        'poll_stats': country.poll_index.poll_stats,
+        'states': [
+            {
+                'name': state.name,
+                'postal_code': state.postal_code,
+                'district_codes': sorted(state.district_codes),
+                'cd_codes': state.cd_codes,
+                'ec_value': int(state.ec_value)
+            }
+            for state in country.states
+        ]
+    }
+    # Written last, so that a partial snapshot is never mistaken for a complete one
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(meta, data_dir, cycle):
+    # Whether a snapshot was saved by this version of the code, from the current input files of the cycle
+    return (meta is not None
+            and meta['version'] == SNAPSHOT_VERSION
+            and meta['data_dir'] == data_dir
+            and meta['cycle'] == cycle
+            and meta['fingerprint'] == data_fingerprint(data_dir))
+
+
+def load_snapshot(country_class, path, meta):
+    """
+    Rebuild a Country from a snapshot, without reading any input file.
+
+    :param country_class: Country
+    :param path: snapshot directory
+    :param meta: parsed meta.json of the snapshot
+    :return: Country
+    """
+    # Late imports, since elections imports this module
+    from elections import State, Race
+    from polls import PollIndex
+    from scorer import Scorer
+
+    arrays = {}
+    for name in meta['arrays']:
+        array = np.load(os.path.join(path, name + '.npy'), allow_pickle=False,
+                        mmap_mode='c' if name in MAPPED_ARRAYS else None)
+        arrays[name] = array.astype(object) if name in OBJECT_ARRAYS else array
+
+    country = country_class.__new__(country_class)
+    country.data_dir = meta['data_dir']
+    country.cycle = meta['cycle']
+    country.elections = CYCLES[country.cycle]
+    country.official_scorer = Scorer(country.data_dir, tables={
+        name[len('scorer_'):]: array for name, array in arrays.items() if name.startswith('scorer_')
+    })
+    country.poll_index = PollIndex()
+    country.result_cache = None
+    country.poll_index.poll_files = meta['poll_files']
+    country.poll_index.poll_stats = {path: tuple(stat) for path, stat in meta['poll_stats'].items()}
+    country.state_codes = meta['state_codes']
+    country.state_turnouts = meta['state_turnouts']
+    country.district_turnouts = defaultdict(int, meta['district_turnouts'])
+    country.ec_turnouts = defaultdict(int, meta['ec_turnouts'])
+    country.ec_values = defaultdict(int, meta['ec_values'])
+    country.senators = {code: tuple(senator) for code, senator in meta['senators'].items()}
+    country.representatives = {code: tuple(representative) for code, representative in meta['representatives'].items()}
+    country.statuses = meta['statuses']
+    country.status_polls = defaultdict(dict)
+    for status, polls in meta['status_polls'].items():
+        for election, code, share, sample_size in polls:
+            country.status_polls[status][election, code] = (share, sample_size)
+
+    # Races hold no state of their own, they are bound to rows of the table
+    n_races = len(arrays['codes'])
+    races = [Race.__new__(Race) for _ in range(n_races)]
+    for race, race_meta in zip(races, meta['races']):
+        race.official_scorer = country.official_scorer
+        race.default_incumbent = tuple(race_meta['default_incumbent'])
+        race.info_dir = race_meta['info_dir']
+        race.inferred_status = race_meta['inferred_status']
+    table = RaceTable.from_columns(races, {name: arrays[name] for name in TABLE_COLUMNS})
+
+    country.states = []
+    for i, state_meta in enumerate(meta['states']):
+        state = State.__new__(State)
+        state.name = state_meta['name']
+        state.postal_code = state_meta['postal_code']
+        state.district_codes = set(state_meta['district_codes'])
+        state.country = country
+        state.state_info_dir = country.info_dir('senate')
+        state.district_info_dir = country.info_dir('house')
+        state.ec_info_dir = country.info_dir('ec')
+        state.ec_value = state_meta['ec_value']
+        state.cd_codes = state_meta['cd_codes']
+        seats = {'ec': {}, 'house': {}, 'senate': {}}
+        for row in np.flatnonzero(table.state_indices == i):
+            seats[table.chambers[row]][table.codes[row]] = races[row]
+        state.electoral_college = seats['ec']
+        state.districts = seats['house']
+        state.senate_seats = seats['senate']
+        country.states.append(state)
+
+    country.race_table = table
+    country.init_race_batches()
+    return country
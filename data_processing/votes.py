@@ -1,8 +1,31 @@
+import hashlib
+import os
+import re
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from fingerprint import file_digest, value_digest, save_arrays
 from scorer import Scorer
 from sklearn.linear_model import LogisticRegression
 import numpy as np
 
+# Bump when the layout of cached vote models changes
+VOTES_CACHE_VERSION = 2
+
+# VoteView cast codes of yea and nay positions. Other codes, e.g. 0 for not in the chamber or 9 for not voting,
+# are left out of a roll call
+YEA_CODES = (1, 2, 3)
+NAY_CODES = (4, 5, 6)
+
+# Chamber of a VoteView member id, e.g. MH11421163
+MEMBER_CHAMBERS = {'MH': 'house', 'MS': 'senate'}
+
+
+def fit_vote(scores, votes):
+    # Same model as ChamberVote, returning only what its decisions need
+    logreg = LogisticRegression(C=1e5, solver='lbfgs', multi_class='multinomial')
+    logreg.fit(scores, votes)
+    return logreg.coef_[0], logreg.intercept_[0], logreg.classes_
+
 class ChamberVote:
     def __init__(self, path_to_vote_file, official_scorer, vote_col='V1'):
         self.votes = []
@@ -25,6 +48,163 @@ class ChamberVote:
         
         self.logreg = logreg
 
+    @classmethod
+    def from_coefficients(cls, coef, intercept, classes):
+        # A ChamberVote of an already fitted model, e.g. from a VoteLibrary
+        vote = cls.__new__(cls)
+        vote.logreg = LogisticRegression(C=1e5, solver='lbfgs', multi_class='multinomial')
+        vote.logreg.coef_ = np.asarray(coef, dtype=float).reshape(1, -1)
+        vote.logreg.intercept_ = np.asarray(intercept, dtype=float).reshape(1)
+        vote.logreg.classes_ = np.asarray(classes)
+        vote.logreg.n_features_in_ = vote.logreg.coef_.shape[1]
+        return vote
+
+    def digest(self):
+        # Hash of the fitted model, equal for votes that predict the same results
+        return value_digest(self.logreg.coef_, self.logreg.intercept_, self.logreg.classes_)
+
     def get_result(self, scores):
-        return self.logreg.predict(scores).sum()
+        return self.get_results(np.asarray(scores)[np.newaxis])[0]
+
+    def get_results(self, scores):
+        # Sum of predicted votes for each chamber in an (n_sims, n_seats, 2) array of scores
+        # Same as predict, without its input validation: the class is the sign of the linear decision function
+        scores = np.asarray(scores, dtype=float)
+        decisions = scores.reshape(-1, scores.shape[-1]) @ self.logreg.coef_.T + self.logreg.intercept_
+        votes = self.logreg.classes_[(decisions[:, 0] > 0).astype(int)]
+        return votes.reshape(scores.shape[:-1]).sum(axis=-1)
+
+
+class VoteLibrary:
+    def __init__(self, path_to_vote_file, official_scorer, vote_cols=None, max_workers=None, use_cache=True):
+        """
+        Models of every roll call of a vote file, e.g. V1 to V10 of close_votes.csv. Member scores are looked up once,
+        models are fitted in parallel, and their coefficients are cached next to the scorer's, keyed by the hash of
+        the vote file and member scores. Only yea and nay positions are modeled, so members who were not in the
+        chamber (0) or did not vote (9) are left out of each roll call. Descriptions of roll_call_descriptions.csv,
+        next to the vote file, are matched to the vote file's roll calls by order.
+        :param path_to_vote_file: csv of icpsr and one column of positions per roll call, 1 for yea
+        :param official_scorer: Scorer
+        :param vote_cols: roll calls to model, defaults to every column named V<number>
+        :param max_workers: number of processes fitting models, or 1 to fit them in this process
+        :param use_cache: read and write cached coefficients
+        """
+        vote_df = pd.read_csv(path_to_vote_file)
+        if vote_cols is None:
+            vote_cols = [col for col in vote_df.columns if re.fullmatch(r'V\d+', col)]
+        all_vote_cols = [col for col in vote_df.columns if re.fullmatch(r'V\d+', col)]
+        self.vote_cols = list(vote_cols)
+        self.member_scores = official_scorer.get_icpsr_scores(vote_df['icpsr'])
+        positions = vote_df[self.vote_cols].to_numpy()
+
+        key = hashlib.sha256()
+        key.update(file_digest(path_to_vote_file).encode())
+        key.update(self.member_scores.tobytes())
+        key.update(','.join(self.vote_cols).encode())
+        cache_path = os.path.join(os.path.dirname(official_scorer.cache_path), f'votes_{key.hexdigest()}.npz')
+
+        models = self.read_cache(cache_path) if use_cache else None
+        if models is None:
+            models = self.fit(positions, max_workers)
+            if use_cache:
+                self.write_cache(cache_path, models)
+        self.coefs, self.intercepts, self.classes = models
+
+        self.votes = {
+            vote_col: ChamberVote.from_coefficients(coef, intercept, classes)
+            for vote_col, coef, intercept, classes in zip(self.vote_cols, self.coefs, self.intercepts, self.classes)
+        }
+
+        # Chamber of every roll call, from the ids of the members who voted in it
+        self.chambers = {}
+        if 'id' in vote_df:
+            for vote_col, column in zip(self.vote_cols, positions.T):
+                voted = np.isin(column, YEA_CODES + NAY_CODES)
+                chambers = {MEMBER_CHAMBERS.get(member_id[:2]) for member_id in vote_df['id'][voted]}
+                if len(chambers) == 1:
+                    self.chambers[vote_col] = chambers.pop()
+
+        # Descriptions are numbered from V0, so they are matched by order rather than by label
+        descriptions_path = os.path.join(os.path.dirname(path_to_vote_file), 'roll_call_descriptions.csv')
+        self.descriptions = {}
+        if os.path.exists(descriptions_path):
+            descriptions_df = pd.read_csv(descriptions_path, encoding='utf-8-sig')
+            for vote_col, (_, row) in zip(all_vote_cols, descriptions_df.iterrows()):
+                if vote_col in self.votes:
+                    self.descriptions[vote_col] = row['description']
+                    self.chambers.setdefault(vote_col, row['chamber'].lower())
+        self.chamber_libraries = {}
+
+    def fit(self, positions, max_workers=None):
+        # Coefficients, intercepts and classes of every roll call, stacked
+        args = ([], [])
+        for column in positions.T:
+            present = np.isin(column, YEA_CODES + NAY_CODES)
+            args[0].append(self.member_scores[present])
+            args[1].append(np.where(np.isin(column[present], YEA_CODES), 1, -1))
+
+        if max_workers == 1:
+            fits = [fit_vote(*vote_args) for vote_args in zip(*args)]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                fits = list(executor.map(fit_vote, *args))
+        coefs, intercepts, classes = zip(*fits)
+        return np.array(coefs), np.array(intercepts), np.array(classes)
+
+    @staticmethod
+    def read_cache(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                if cache['version'] != VOTES_CACHE_VERSION:
+                    return None
+                return cache['coefs'], cache['intercepts'], cache['classes']
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def write_cache(cache_path, models):
+        coefs, intercepts, classes = models
+        save_arrays(cache_path, version=VOTES_CACHE_VERSION, coefs=coefs, intercepts=intercepts, classes=classes)
+
+    def chamber_votes(self, chamber):
+        """
+        The roll calls of a single chamber, as a VoteLibrary of their own. Roll calls of unknown chamber are kept.
+
+        :param chamber: 'house' or 'senate'
+        :return: VoteLibrary, the same one for every call, so that its predicted seat votes are cached
+        """
+        if chamber not in self.chamber_libraries:
+            selected = [i for i, vote_col in enumerate(self.vote_cols)
+                        if self.chambers.get(vote_col, chamber) == chamber]
+            library = VoteLibrary.__new__(VoteLibrary)
+            library.vote_cols = [self.vote_cols[i] for i in selected]
+            library.member_scores = self.member_scores
+            library.coefs = self.coefs[selected]
+            library.intercepts = self.intercepts[selected]
+            library.classes = self.classes[selected]
+            library.votes = {vote_col: self.votes[vote_col] for vote_col in library.vote_cols}
+            library.chambers = {vote_col: self.chambers[vote_col] for vote_col in library.vote_cols
+                                if vote_col in self.chambers}
+            library.descriptions = {vote_col: self.descriptions[vote_col] for vote_col in library.vote_cols
+                                    if vote_col in self.descriptions}
+            library.chamber_libraries = {chamber: library}
+            self.chamber_libraries[chamber] = library
+        return self.chamber_libraries[chamber]
+
+    def __getitem__(self, vote_col):
+        return self.votes[vote_col]
+
+    def __len__(self):
+        return len(self.vote_cols)
+
+    def get_results(self, scores):
+        """
+        Sum of predicted votes of every roll call, in one stacked decision for all of them.
 
+        :param scores: (..., n_seats, 2) array of scores
+        :return: (..., n_votes) array of vote margins
+        """
+        scores = np.asarray(scores, dtype=float)
+        decisions = scores.reshape(-1, scores.shape[-1]) @ self.coefs.T + self.intercepts
+        votes = np.where(decisions > 0, self.classes[:, 1], self.classes[:, 0])
+        return votes.reshape(scores.shape[:-1] + (len(self),)).sum(axis=-2)
@@ -0,0 +1,52 @@
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import shutil
+import sys
+
+# Modules of data_processing import each other by name, as when run from that directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+
+from elections import Country
+from votes import ChamberVote
+
+# Bundled data, without scores.csv, the VoteView member file
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    """
+    Copy of the bundled data, with a scores.csv of one democrat and one republican per state, so that every race
+    falls back to its state's party mean.
+    """
+    path = str(tmp_path_factory.mktemp('data'))
+    shutil.copytree(DATA_DIR, path, dirs_exist_ok=True)
+    postal_codes = pd.read_csv(os.path.join(DATA_DIR, 'state_info', 'state_codes.csv'))['postal_code']
+    rng = np.random.default_rng(0)
+    members = []
+    for i, postal_code in enumerate(postal_codes):
+        for party_code, sign in ((100, -1), (200, 1)):
+            members.append({
+                'congress': 116,
+                'icpsr': 2 * i + party_code // 100,
+                'state_abbrev': postal_code,
+                'party_code': party_code,
+                'bioname': f'MEMBER{2 * i + party_code // 100}, Test',
+                'nominate_dim1': sign * rng.uniform(0.2, 0.6),
+                'nominate_dim2': rng.uniform(-0.3, 0.3)
+            })
+    pd.DataFrame(members).to_csv(os.path.join(path, 'scores.csv'), index=False)
+    return path
+
+
+@pytest.fixture
+def country(data_dir):
+    return Country(data_dir)
+
+
+@pytest.fixture
+def vote():
+    # Republicans vote yea, democrats nay
+    return ChamberVote.from_coefficients([1.0, 0.0], 0.0, [-1, 1])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from definitions import PARTIES
+from elections import Race
+from race_table import RaceTable, RaceBatch
+from simulation import VICE_PRESIDENT_SCORE, NO_EXTRA_SCORES
+from votes import ChamberVote
+
+
+def synthetic_chamber(seed=0, n_frozen=30, n_contested=41):
+    """
+    A chamber of uncontested seats split evenly between parties, and close contested seats, whose vote is decided by a
+    single vote in a narrow band of national bias.
+    """
+    rng = np.random.default_rng(seed)
+    n_races = 2 * n_frozen + n_contested
+    republican = np.arange(n_races) % 2 == 0
+    contested = np.arange(n_races) >= 2 * n_frozen
+    incumbent_scores = np.where(republican[:, np.newaxis], [0.5, 0.0], [-0.5, 0.0])
+    columns = {
+        'chambers': np.array(['house'] * n_races),
+        'state_indices': np.zeros(n_races, dtype=int),
+        'codes': np.array([f'XX{i}' for i in range(n_races)], dtype=object),
+        'turnouts': np.full(n_races, 100000.0),
+        'values': np.ones(n_races, dtype=int),
+        'contested': contested,
+        'sample_sizes': np.where(contested, 600.0, 0.0),
+        'incumbent_projected_vote_shares': np.where(contested, rng.uniform(0.47, 0.53, n_races), 1.0),
+        'incumbent_names': np.array(['_'] * n_races, dtype=object),
+        'incumbent_parties': np.where(republican, PARTIES.index('R'), PARTIES.index('D')).astype(np.int8),
+        'challenger_parties': np.where(republican, PARTIES.index('D'), PARTIES.index('R')).astype(np.int8),
+        'incumbent_scores': incumbent_scores,
+        'challenger_scores': -incumbent_scores
+    }
+    table = RaceTable.from_columns([Race.__new__(Race) for _ in range(n_races)], columns)
+    return RaceBatch(table, table.rows())
+
+
+@pytest.mark.parametrize('bias_sd', [0.02, 0.04])
+def test_pivot_probability_matches_monte_carlo(bias_sd):
+    batch = synthetic_chamber()
+    vote = ChamberVote.from_coefficients([1.0, 0.0], 0.0, [-1, 1])
+    exact = batch.pivot_probability(vote, bias_sd)
+
+    rng = np.random.default_rng(1)
+    pivots = np.concatenate([
+        np.abs(batch.simulate_results(rng.normal(0, bias_sd, 50000), vote, random_state=rng)) == 1
+        for _ in range(4)
+    ])
+    standard_error = np.sqrt(exact * (1 - exact) / len(pivots))
+    assert abs(pivots.mean() - exact) < 4 * standard_error
+
+
+def test_senate_pivot_probability_counts_the_vice_president(country, vote):
+    # Without the vice president, the margin of a hundred senators is always even
+    assert country.chamber_pivot_probability(vote, 'senate', 0.02, NO_EXTRA_SCORES) == 0
+    exact = country.chamber_pivot_probability(vote, 'senate', 0.02)
+    assert exact == country.chamber_pivot_probability(vote, 'senate', 0.02, VICE_PRESIDENT_SCORE)
+
+    rng = np.random.default_rng(2)
+    margins = country.simulate_chamber_results('senate', rng.normal(0, 0.02, 200000), vote, random_state=rng)
+    standard_error = np.sqrt(exact * (1 - exact) / len(margins))
+    assert abs(np.mean(np.abs(margins) == 1) - exact) < 4 * standard_error
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from definitions import REGIONS
+from error_model import RegionalErrorModel
+
+
+@pytest.mark.parametrize('region_sd, state_sd', [(0.01, 0.01), (0.02, 0.0), (0.0, 0.02)])
+def test_state_errors_have_the_model_covariance(country, region_sd, state_sd):
+    model = RegionalErrorModel(country, region_sd, state_sd)
+    region_of = {postal_code: region for region, postal_codes in REGIONS.items() for postal_code in postal_codes}
+    regions = np.array([region_of[state.postal_code] for state in country.states])
+    same_region = regions[:, np.newaxis] == regions[np.newaxis, :]
+    expected = region_sd ** 2 * same_region + state_sd ** 2 * np.eye(len(regions))
+    np.testing.assert_allclose(model.covariance, expected, atol=1e-15)
+
+    n_sims = 200000
+    errors = model.sample_state_errors(n_sims, np.random.default_rng(0))
+    # Several standard errors of the sample covariance, over every pair of states
+    np.testing.assert_allclose(np.cov(errors, rowvar=False), expected, atol=6 * expected.max() * np.sqrt(2 / n_sims))
@@ -0,0 +1,47 @@
+import numpy as np
+
+from race_table import RaceTable, RaceBatch
+from simulation import DEFAULT_EXTRA_SCORES
+
+# Arrays a RaceBatch gathers from its table when it refreshes
+BATCH_ARRAYS = ['values', 'turnouts', 'incumbent_parties', 'challenger_parties', 'incumbent_scores',
+                'challenger_scores', 'contested', 'contested_index', 'sample_sizes', 'expected_values', 'stddevs', 'a', 'b', 'bias_signs']
+
+
+def test_refresh_matches_rebuild(country, vote):
+    table = country.race_table
+    batches = {chamber: country.race_batch(chamber) for chamber in ('house', 'senate')}
+    # Fill the seat votes cache, which edits must invalidate
+    before = {chamber: batch.pivot_probability(vote, 0.02, DEFAULT_EXTRA_SCORES.get(chamber))
+              for chamber, batch in batches.items()}
+
+    races = {(chamber, code): race for chamber, code, race in zip(table.chambers, table.codes, table.races)}
+    contested = races['senate', 'NC']
+    contested.incumbent_projected_vote_share -= 0.02
+    newly_contested = races['senate', 'AL2']
+    newly_contested.contested = True
+    newly_contested.incumbent_projected_vote_share = 0.5
+    newly_contested.sample_size = 800
+    newly_contested.challenger_score = country.official_scorer.get_score(
+        ('_', newly_contested.challenger_party), newly_contested.code)
+    house_race = races['house', table.codes[batches['house'].rows[batches['house'].contested_index[0]]]]
+    house_race.incumbent_score = -house_race.incumbent_score
+    house_race.contested = False
+
+    rebuilt_table = RaceTable(list(table.races), table.chambers.copy(), table.state_indices.copy())
+    for chamber, batch in batches.items():
+        refreshed = country.race_batch(chamber)
+        assert refreshed is batch
+        rebuilt = RaceBatch(rebuilt_table, batch.rows)
+        assert refreshed.codes == rebuilt.codes
+        for name in BATCH_ARRAYS:
+            np.testing.assert_array_equal(getattr(refreshed, name), getattr(rebuilt, name), err_msg=name)
+
+        extra = DEFAULT_EXTRA_SCORES.get(chamber)
+        power = refreshed.pivot_probability(vote, 0.02, extra)
+        assert power != before[chamber]
+        assert power == rebuilt.pivot_probability(vote, 0.02, extra)
+        np.testing.assert_array_equal(refreshed.tipping_point_probabilities(), rebuilt.tipping_point_probabilities())
+        biases = np.linspace(-0.04, 0.04, 50)
+        np.testing.assert_array_equal(refreshed.simulate_results(biases, vote, random_state=np.random.default_rng(0)),
+                                      rebuilt.simulate_results(biases, vote, random_state=np.random.default_rng(0)))
@@ -0,0 +1,24 @@
+import numpy as np
+
+from scenario import Scenario
+from simulation import VICE_PRESIDENT_SCORE
+
+
+def test_contesting_a_seat_matches_contesting_it_in_place(country, vote):
+    table = country.race_table
+    row = np.flatnonzero((table.chambers == 'senate') & (table.codes == 'AL2'))[0]
+    assert not table.contested[row]
+    base_power = country.chamber_pivot_probability(vote, 'senate', 0.02, VICE_PRESIDENT_SCORE)
+
+    scenario = Scenario().patch('senate', 'AL2', incumbent_projected_vote_share=0.5, sample_size=800)
+    power, _ = country.evaluate_scenarios([scenario], vote)
+
+    race = table.races[row]
+    race.contested = True
+    race.incumbent_projected_vote_share = 0.5
+    race.sample_size = 800
+    race.challenger_score = country.official_scorer.get_score(('_', race.challenger_party), race.code)
+    contested_power = country.chamber_pivot_probability(vote, 'senate', 0.02, VICE_PRESIDENT_SCORE)
+
+    assert abs(contested_power - base_power) > 1e-3
+    assert np.isclose(power['senate'][0], contested_power, rtol=1e-6)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import pytest
+
+from service import VoterPowerService
+
+
+@pytest.fixture
+def service(data_dir, vote):
+    service = VoterPowerService(data_dir, vote_files=())
+    service.votes['test'] = vote
+    return service
+
+
+def get(service, target):
+    # Status and JSON body of a GET request to the service, over a local connection
+    async def request():
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body)
+    return asyncio.run(request())
+
+
+def test_races_and_power(service):
+    status, body = get(service, '/races?chamber=senate')
+    assert status == 200
+    assert body == service.country.tipping_point_probabilities('senate')
+
+    status, body = get(service, '/power?vote=test&bias_sd=0.02')
+    assert status == 200
+    assert body == {chamber: service.country.chamber_pivot_probability(service.votes['test'], chamber, 0.02)
+                    for chamber in ('house', 'senate')}
+    assert body['senate'] > 0
+
+    status, body = get(service, '/rankings?chamber=senate&limit=3')
+    assert status == 200
+    assert [race['code'] for race in body] == sorted(
+        service.country.tipping_point_probabilities('senate'),
+        key=lambda code: -service.country.tipping_point_probabilities('senate')[code])[:3]
+
+
+@pytest.mark.parametrize('target', ['/races?chamber=hosue', '/rankings?chamber=ec', '/power?vote=unknown',
+                                    '/races?mode=unknown'])
+def test_bad_requests(service, target):
+    status, body = get(service, target)
+    assert status == 400
+    assert body['error']
+    assert service.health()['cached_results'] == 0
+
+
+def test_unknown_path(service):
+    status, body = get(service, '/nowhere')
+    assert status == 404
+    assert '/races' in body['paths']
@@ -0,0 +1,23 @@
+import numpy as np
+
+from simulation import SimulationRunner
+
+
+def test_results_do_not_depend_on_the_number_of_workers(country, vote):
+    runs = [SimulationRunner(country, vote, chunk_size=500, seed=7, max_workers=max_workers)
+            for max_workers in (1, 3)]
+
+    results = [runner.run(2200) for runner in runs]
+    assert results[0].keys() == results[1].keys()
+    for key in results[0]:
+        np.testing.assert_array_equal(results[0][key], results[1][key])
+
+    summaries = [runner.summarize(2200) for runner in runs]
+    assert summaries[0].keys() == summaries[1].keys()
+    for name in summaries[0]:
+        assert vars(summaries[0][name]).keys() == vars(summaries[1][name]).keys()
+        for attribute, value in vars(summaries[0][name]).items():
+            np.testing.assert_array_equal(value, vars(summaries[1][name])[attribute])
+
+    adaptive = [runner.adaptive_chamber_power(rel_se=0.2, initial_sims=1000, max_sims=4000) for runner in runs]
+    assert adaptive[0] == adaptive[1]
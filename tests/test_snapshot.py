@@ -0,0 +1,41 @@
+import numpy as np
+import os
+import shutil
+
+import snapshot
+from elections import Country
+
+
+def test_snapshot_round_trip(country, vote, tmp_path):
+    path = str(tmp_path / 'snapshot')
+    country.save_snapshot(path)
+    loaded = Country.load_snapshot(path)
+
+    assert loaded.cycle == country.cycle
+    for name, column in country.race_table.columns().items():
+        np.testing.assert_array_equal(getattr(loaded.race_table, name), column)
+    for chamber in ('ec', 'house', 'senate'):
+        assert loaded.tipping_point_probabilities(chamber) == country.tipping_point_probabilities(chamber)
+    assert (loaded.chamber_pivot_probability(vote, 'senate', 0.02)
+            == country.chamber_pivot_probability(vote, 'senate', 0.02))
+
+
+def test_changed_input_rejects_snapshot(data_dir, tmp_path, monkeypatch):
+    data = str(tmp_path / 'data')
+    shutil.copytree(data_dir, data)
+    path = str(tmp_path / 'snapshot')
+    Country(data).save_snapshot(path)
+    assert snapshot.is_current(snapshot.read_meta(path), data, 2020)
+
+    poll_path = os.path.join(data, 'state_info', 'NC_Tillis_R.csv')
+    with open(poll_path, 'a') as f:
+        f.write('\n')
+    assert not snapshot.is_current(snapshot.read_meta(path), data, 2020)
+
+    def stale_load(*args):
+        raise AssertionError('Loaded a stale snapshot')
+    monkeypatch.setattr(snapshot, 'load_snapshot', stale_load)
+    rebuilt = Country.load_snapshot(path, data)
+    assert rebuilt.data_dir == data
+    # The rebuilt Country was saved again
+    assert snapshot.is_current(snapshot.read_meta(path), data, 2020)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from race_table import RaceBatch
+
+
+def test_quadrature_matches_adaptive_reference(country):
+    errors = country.tipping_point_error(mode='quadrature')
+    assert errors['max_rel_error'] < 1e-8
+
+
+def test_adaptive_reference_matches_dense_grid(country):
+    # The closest house races, on a grid fine enough to resolve their binomial peak directly
+    batch = country.race_batch('house')
+    reference = batch.adaptive_tipping_point_probabilities()
+    for row in np.argsort(reference)[-3:]:
+        dense = RaceBatch(batch.table, batch.rows[[row]]).tipping_point_probabilities(order=512, width=30)
+        assert reference[row] == pytest.approx(dense[0], rel=1e-8)
+
+
+@pytest.mark.parametrize('reference', ['quadrature', 'adaptive'])
+def test_analytic_matches_integrated_modes(country, reference):
+    errors = country.tipping_point_error(mode='analytic', reference=reference)
+    assert errors['max_rel_error'] < 1e-6
+
+
+@pytest.mark.parametrize('chamber, mode', [('hosue', 'quadrature'), ('government', 'quadrature'), ('house', 'exakt')])
+def test_unknown_chamber_or_mode(country, chamber, mode):
+    with pytest.raises(ValueError):
+        country.tipping_point_probabilities(chamber, mode)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from sklearn.linear_model import LogisticRegression
+from test_chamber_power import synthetic_chamber
+from votes import ChamberVote
+
+
+@pytest.fixture
+def vote():
+    # A ChamberVote fitted like the real ones, on members whose position mostly follows their first score
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=(200, 2))
+    votes = np.where(scores[:, 0] + 0.3 * scores[:, 1] + rng.normal(0, 0.2, 200) > 0, 1, -1)
+    chamber_vote = ChamberVote.__new__(ChamberVote)
+    chamber_vote.logreg = LogisticRegression(C=1e5, solver='lbfgs').fit(scores, votes)
+    return chamber_vote
+
+
+def predicted_results(vote, scores):
+    # Reference: sum of LogisticRegression.predict over every seat
+    return vote.logreg.predict(scores.reshape(-1, 2)).reshape(scores.shape[:-1]).sum(axis=-1)
+
+
+def test_get_results_matches_predict_on_random_scores(vote):
+    scores = np.random.default_rng(1).normal(size=(50, 100, 2))
+    np.testing.assert_array_equal(vote.get_results(scores), predicted_results(vote, scores))
+
+
+def test_get_results_matches_predict_near_the_decision_boundary(vote):
+    # Points on the boundary, and a hair to either side of it
+    rng = np.random.default_rng(2)
+    coef = vote.logreg.coef_[0]
+    points = rng.normal(size=(1000, 2))
+    points -= np.outer(points @ coef + vote.logreg.intercept_[0], coef) / (coef @ coef)
+    offsets = np.array([-1e-12, 0, 1e-12])[:, np.newaxis, np.newaxis] * coef
+    scores = (points + offsets).reshape(30, 100, 2)
+    np.testing.assert_array_equal(vote.get_results(scores), predicted_results(vote, scores))
+
+
+def test_get_results_matches_predict_on_simulated_chambers(vote):
+    batch = synthetic_chamber()
+    rng = np.random.default_rng(3)
+    scores = batch.simulate_scores(rng.normal(0, 0.02, 500), random_state=rng)
+    np.testing.assert_array_equal(vote.get_results(scores), predicted_results(vote, scores))
+    np.testing.assert_array_equal(vote.get_result(scores[0]), predicted_results(vote, scores[0]))